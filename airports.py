@@ -0,0 +1,250 @@
+"""
+Compact airport index shared by the dashboard and the scheduler.
+
+airports.json is the human-readable source of truth. generate_airports.py also
+writes airports.bin next to it: a fixed-width binary layout that can be
+memory-mapped and queried without parsing ~800KB of JSON in every process.
+
+Layout (little-endian):
+    header   magic, format version, record count, section offsets, dataset digest
+    records  one RECORD per airport, sorted by IATA code (binary-searchable)
+    order    uint32 record indexes in display order (city, then code)
+    strings  UTF-8 string table: city and name per record
+    labels   newline-separated picker labels, in display order
+    keys     newline-separated lowercased search keys, in display order
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+JSON_PATH = os.path.join(BASE_DIR, 'airports.json')
+BIN_PATH = os.path.join(BASE_DIR, 'airports.bin')
+
+MAGIC = b'FHAP'
+FORMAT_VERSION = 1
+
+# magic, format version, record count, order/strings/labels/keys offsets, total size, digest
+HEADER = struct.Struct('<4sHxxIIIIII16s')
+# code, country, city offset, city length, name length
+RECORD = struct.Struct('<3s2sxIHH')
+ORDER_ITEM = struct.Struct('<I')
+
+
+def sort_key(airport):
+    """Display order: city name (case-insensitive), then IATA code."""
+    return (airport['city'].lower(), airport['code'])
+
+
+def format_label(airport):
+    """The label shown in the dashboard's airport pickers."""
+    return f"{airport['city']} - {airport['name']} ({airport['code']})"
+
+
+def code_from_label(label):
+    """Extracts the IATA code from a label produced by format_label()."""
+    return label[-4:-1]
+
+
+def canonical_json(airports):
+    """Serializes airports deterministically (stable order, stable formatting)."""
+    ordered = sorted(airports, key=sort_key)
+    return json.dumps(ordered, indent=2, ensure_ascii=False) + "\n"
+
+
+def dataset_digest(json_text):
+    """Short content hash used as the dataset version."""
+    return hashlib.sha256(json_text.encode()).digest()[:16]
+
+
+def build_binary(airports, digest=b''):
+    """Encodes a list of airport dicts into the airports.bin layout."""
+    by_code = sorted(airports, key=lambda a: a['code'])
+    strings = bytearray()
+    records = bytearray()
+    for a in by_code:
+        city = a['city'].encode()
+        name = a['name'].encode()
+        records += RECORD.pack(a['code'].encode('ascii'), a['country'].encode('ascii')[:2],
+                               len(strings), len(city), len(name))
+        strings += city + name
+
+    display = sorted(airports, key=sort_key)
+    position = {a['code']: i for i, a in enumerate(by_code)}
+    order = b''.join(ORDER_ITEM.pack(position[a['code']]) for a in display)
+    labels = "\n".join(format_label(a) for a in display)
+    labels_blob = labels.encode()
+    keys_blob = labels.lower().encode()
+
+    order_off = HEADER.size + len(records)
+    strings_off = order_off + len(order)
+    labels_off = strings_off + len(strings)
+    keys_off = labels_off + len(labels_blob)
+    total = keys_off + len(keys_blob)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(by_code), order_off, strings_off,
+                         labels_off, keys_off, total, digest.ljust(16, b'\0')[:16])
+    return header + bytes(records) + order + bytes(strings) + labels_blob + keys_blob
+
+
+class AirportIndex:
+    """Read-only view over an airports.bin buffer (bytes or mmap)."""
+
+    def __init__(self, buf):
+        (magic, version, count, order_off, strings_off,
+         labels_off, keys_off, total, digest) = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != FORMAT_VERSION or len(buf) != total:
+            raise ValueError(f"Unsupported airport index (magic={magic!r}, version={version})")
+        self._buf = buf
+        self._count = count
+        self._order_off = order_off
+        self._strings_off = strings_off
+        self._labels_off = labels_off
+        self._keys_off = keys_off
+        self._total = total
+        self.version = digest.hex()
+        self._labels = None
+        self._keys = None
+
+    def __len__(self):
+        return self._count
+
+    def _code_at(self, i):
+        off = HEADER.size + i * RECORD.size
+        return self._buf[off:off + 3].decode('ascii')
+
+    def _record(self, i):
+        code, country, city_off, city_len, name_len = RECORD.unpack_from(
+            self._buf, HEADER.size + i * RECORD.size)
+        start = self._strings_off + city_off
+        city = self._buf[start:start + city_len].decode()
+        name = self._buf[start + city_len:start + city_len + name_len].decode()
+        return {"code": code.decode('ascii'), "name": name, "city": city, "country": country.decode('ascii')}
+
+    def _display_order(self):
+        off = self._order_off
+        return struct.unpack_from(f'<{self._count}I', self._buf, off)
+
+    def _find(self, code):
+        # Binary search directly over the fixed-width code column
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._code_at(mid) < code:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self._count and self._code_at(lo) == code else None
+
+    def __contains__(self, code):
+        return self._find(str(code).upper()) is not None
+
+    def get(self, code):
+        """Returns the airport dict for an IATA code, or None."""
+        i = self._find(str(code).upper())
+        return self._record(i) if i is not None else None
+
+    def labels(self):
+        """Picker labels in display order, decoded once per process."""
+        if self._labels is None:
+            blob = self._buf[self._labels_off:self._keys_off]
+            self._labels = blob.decode().split("\n")
+        return self._labels
+
+    def search(self, query, limit=20):
+        """Case-insensitive substring match over city, name and code."""
+        if self._keys is None:
+            self._keys = self._buf[self._keys_off:self._total].decode().split("\n")
+        query = query.strip().lower()
+        order = self._display_order()
+        matches = []
+        for pos, key in enumerate(self._keys):
+            if query in key:
+                matches.append(self._record(order[pos]))
+                if len(matches) >= limit:
+                    break
+        return matches
+
+    def __iter__(self):
+        for i in self._display_order():
+            yield self._record(i)
+
+
+def _index_from_json(json_path):
+    with open(json_path, 'r') as f:
+        text = f.read()
+    return AirportIndex(build_binary(json.loads(text), dataset_digest(text)))
+
+
+def load_airports(bin_path=BIN_PATH, json_path=JSON_PATH, use_mmap=True):
+    """
+    Loads the airport index, preferring the compact binary artifact.
+    Falls back to building the index from airports.json when airports.bin is
+    missing or was written by an incompatible format version.
+    """
+    try:
+        with open(bin_path, 'rb') as f:
+            if use_mmap:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                buf = f.read()
+        return AirportIndex(buf)
+    except (OSError, ValueError, struct.error):
+        return _index_from_json(json_path)
+
+
+_default_index = None
+
+
+def get_airports():
+    """Process-wide airport index (loaded on first use)."""
+    global _default_index
+    if _default_index is None:
+        _default_index = load_airports()
+    return _default_index
+
+
+def display_name(code):
+    """"City (CODE)" for an IATA code, or the code itself when it isn't in the dataset."""
+    airport = get_airports().get(code) if code else None
+    return f"{airport['city']} ({airport['code']})" if airport else (code or "?")
+
+
+def benchmark(rounds=20):
+    """Compares load + first-lookup time of airports.json against airports.bin."""
+    def timed(fn):
+        best = float('inf')
+        for _ in range(rounds):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best * 1000
+
+    def load_json():
+        with open(JSON_PATH, 'r') as f:
+            data = json.load(f)
+        [format_label(a) for a in data]
+
+    def load_bin(use_mmap):
+        load_airports(use_mmap=use_mmap).get('SFO')
+
+    print(f"airports.json: parse + labels     {timed(load_json):7.2f} ms")
+    if not os.path.exists(BIN_PATH):
+        print("airports.bin not found — run generate_airports.py first.")
+        return
+    print(f"airports.bin:  read + lookup      {timed(lambda: load_bin(False)):7.2f} ms")
+    print(f"airports.bin:  mmap + lookup      {timed(lambda: load_bin(True)):7.2f} ms")
+    print(f"airports.bin:  mmap + labels      {timed(lambda: load_airports().labels()):7.2f} ms")
+    print(f"sizes: json {os.path.getsize(JSON_PATH):,} B, bin {os.path.getsize(BIN_PATH):,} B")
+
+
+if __name__ == "__main__":
+    if "--benchmark" in sys.argv:
+        benchmark()
+    else:
+        idx = get_airports()
+        print(f"Loaded {len(idx)} airports (dataset {idx.version})")
+        print(idx.get('KEF'))
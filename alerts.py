@@ -0,0 +1,148 @@
+"""
+Vectorized alert rules, evaluated for every route of a cycle at once.
+
+The scheduler collects the cycle's observations into an ObservationBatch and
+evaluate() checks all rules for all routes with NumPy array operations,
+returning which rules fired for which routes.
+
+Rules (per route, stored in the alert_rules table; threshold meaning in brackets):
+    target           price <= the route's target price            [unused]
+    below_average    price at least N% below the route's EWMA     [N, percent]
+    all_time_low     price below the lowest price seen so far     [unused]
+    drop_since_last  price at least N% below the previous check   [N, percent]
+
+Routes without configured rules use DEFAULT_RULES (the classic target alert);
+routes whose rules were all turned off have an empty rule set and never alert.
+NumPy is imported in evaluate() so the dashboard can use the rule definitions
+without loading it.
+"""
+_NAN = float("nan")
+
+RULES = ("target", "below_average", "all_time_low", "drop_since_last")
+DEFAULT_RULES = {"target": None}
+
+RULE_LABELS = {
+    "target": "At or below your target",
+    "below_average": "{threshold:g}% below this route's average",
+    "all_time_low": "New all-time low",
+    "drop_since_last": "Dropped {threshold:g}%+ since last check",
+}
+
+
+def describe(rule, threshold):
+    """Human-readable text for a triggered rule."""
+    return RULE_LABELS[rule].format(threshold=threshold or 0)
+
+
+class ObservationBatch:
+    """Column-oriented buffer of one cycle's observations."""
+
+    def __init__(self):
+        self.route_ids = []
+        self._price = []
+        self._target = []
+        self._lowest = []      # lowest seen before this observation
+        self._average = []     # EWMA before this observation
+        self._previous = []    # previous observed price
+        self._thresholds = {rule: [] for rule in RULES}
+
+    def __len__(self):
+        return len(self.route_ids)
+
+    def add(self, route_id, price, target, lowest=None, average=None, previous=None, rules=None):
+        """Appends one route's observation. rules maps rule name -> threshold (None = no parameter)."""
+        rules = DEFAULT_RULES if rules is None else rules
+        self.route_ids.append(route_id)
+        self._price.append(price)
+        self._target.append(target)
+        self._lowest.append(_NAN if lowest is None else lowest)
+        self._average.append(_NAN if average is None else average)
+        self._previous.append(_NAN if previous is None else previous)
+        for rule in RULES:
+            if rule in rules:
+                threshold = rules[rule]
+                self._thresholds[rule].append(0.0 if threshold is None else threshold)
+            else:
+                self._thresholds[rule].append(_NAN)  # NaN = rule disabled for this route
+
+
+def evaluate(batch):
+    """
+    Evaluates every rule for every route in the batch.
+    Returns {route_id: [(rule, threshold), ...]} for routes where at least one rule fired.
+    """
+    if not len(batch):
+        return {}
+    import numpy as np
+
+    price = np.asarray(batch._price, dtype=float)
+    target = np.asarray(batch._target, dtype=float)
+    lowest = np.asarray(batch._lowest, dtype=float)
+    average = np.asarray(batch._average, dtype=float)
+    previous = np.asarray(batch._previous, dtype=float)
+    thresholds = np.vstack([np.asarray(batch._thresholds[rule], dtype=float) for rule in RULES])
+    enabled = ~np.isnan(thresholds)
+
+    # Comparisons against NaN are False, so routes without history never fire history-based rules
+    with np.errstate(invalid="ignore"):
+        fired = np.vstack([
+            price <= target,
+            price <= average * (1 - thresholds[1] / 100),
+            price < lowest,
+            price <= previous * (1 - thresholds[3] / 100),
+        ]) & enabled
+
+    triggered = {}
+    for rule_idx, route_idx in zip(*np.nonzero(fired)):
+        route_id = batch.route_ids[route_idx]
+        triggered.setdefault(route_id, []).append((RULES[rule_idx], batch._thresholds[RULES[rule_idx]][route_idx] or None))
+    return triggered
+
+
+def _evaluate_scalar(batch):
+    """Reference per-route implementation, used to check and benchmark evaluate()."""
+    triggered = {}
+    for i, route_id in enumerate(batch.route_ids):
+        price = batch._price[i]
+        checks = {
+            "target": price <= batch._target[i],
+            "below_average": price <= batch._average[i] * (1 - batch._thresholds["below_average"][i] / 100),
+            "all_time_low": price < batch._lowest[i],
+            "drop_since_last": price <= batch._previous[i] * (1 - batch._thresholds["drop_since_last"][i] / 100),
+        }
+        for rule in RULES:
+            threshold = batch._thresholds[rule][i]
+            if threshold == threshold and checks[rule]:  # threshold is not NaN
+                triggered.setdefault(route_id, []).append((rule, threshold or None))
+    return triggered
+
+
+if __name__ == "__main__":
+    import random
+    import sys
+    import time
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rng = random.Random(42)
+    batch = ObservationBatch()
+    for route_id in range(n):
+        rules = {"target": None}
+        if route_id % 2:
+            rules.update({"below_average": 15, "all_time_low": None, "drop_since_last": 5})
+        average = rng.uniform(200, 900)
+        batch.add(route_id, average * rng.uniform(0.7, 1.2), average * 0.85,
+                  lowest=average * rng.uniform(0.75, 1.0), average=average,
+                  previous=average * rng.uniform(0.8, 1.2), rules=rules)
+
+    evaluate(batch)  # warm up the NumPy import
+    start = time.perf_counter()
+    vectorized = evaluate(batch)
+    vector_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    scalar = _evaluate_scalar(batch)
+    scalar_ms = (time.perf_counter() - start) * 1000
+
+    assert vectorized == scalar, "vectorized and scalar evaluation disagree"
+    print(f"{n} routes, {len(vectorized)} with alerts")
+    print(f"  vectorized: {vector_ms:.2f} ms")
+    print(f"  per-route:  {scalar_ms:.2f} ms")
@@ -0,0 +1,297 @@
+"""
+Lightweight JSON REST API, served next to the scheduler.
+
+Standard library only (http.server), HTTP/1.1 keep-alive, ETag/If-None-Match
+and gzip. Reads and writes go through database.py, same as the dashboard.
+
+Authentication reuses dashboard sessions: POST /api/login returns a token,
+then send `Authorization: Bearer <token>` with every other request.
+
+    POST   /api/login                      {"username", "password"} -> {"token"}
+    GET    /api/routes                     list your routes
+    POST   /api/routes                     {"origin", "destination", "target_price", "date_from"?, "date_to"?}
+    DELETE /api/routes/<id>
+    GET    /api/routes/<id>/latest         latest observed price
+    GET    /api/routes/<id>/history        ?limit=50&cursor=<next_cursor>
+    POST   /api/routes/<id>/check          refresh now (coalesced with in-flight searches)
+
+HEAD is accepted wherever GET is.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from airports import get_airports
+from bulk import normalize_date
+from refresh import check_route_now
+from database import (get_all_destinations, add_destination, delete_destination, get_destination,
+                      get_latest_price, get_price_history, authenticate_user, create_session,
+                      validate_session, get_user, get_route_stats)
+from price_stats import RouteStats
+
+logger = logging.getLogger(__name__)
+
+API_HOST = os.environ.get("API_HOST", "0.0.0.0")
+API_PORT = int(os.environ.get("API_PORT", "8502"))
+
+HISTORY_DEFAULT_LIMIT = 50
+HISTORY_MAX_LIMIT = 500
+GZIP_MIN_BYTES = 512
+MAX_BODY_BYTES = 64 * 1024
+
+ROUTE_PATH = re.compile(r'^/api/routes/(\d+)(?:/(latest|history|check))?$')
+
+
+class ApiError(Exception):
+    """Raised by handlers to produce a JSON error response."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def route_to_json(dest):
+    return {
+        "id": dest['id'],
+        "origin": dest['departure_city_code'],
+        "destination": dest['destination_city_code'],
+        "target_price": dest['target_price'],
+        "lowest_price_seen": dest['lowest_price_seen'],
+        "date_from": dest['date_from'],
+        "date_to": dest['date_to'],
+        "archived": dest['archived_at'] is not None,
+    }
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive for scripts making several calls
+    server_version = "FlightHawkAPI/1.0"
+    # Headers and body leave in one segment; avoids Nagle/delayed-ACK stalls on keep-alive
+    disable_nagle_algorithm = True
+    wbufsize = 64 * 1024
+
+    # --- plumbing ---
+
+    def log_message(self, format, *args):
+        logger.debug("API %s - " + format, self.address_string(), *args)
+
+    def _send_json(self, status, payload, cacheable=False):
+        body = json.dumps(payload, separators=(',', ':')).encode()
+        headers = {"Content-Type": "application/json"}
+
+        if cacheable:
+            etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+            headers["ETag"] = etag
+            headers["Cache-Control"] = "no-cache"
+            if etag in self.headers.get("If-None-Match", ""):
+                self._send_raw(304, b"", headers)
+                return
+
+        if len(body) >= GZIP_MIN_BYTES and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+            headers["Vary"] = "Accept-Encoding"
+
+        self._send_raw(status, body, headers)
+
+    def _send_raw(self, status, body, headers):
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _read_json(self):
+        """The request body as a JSON object (dict); {} when there is none."""
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True  # can't tell where the body ends
+            raise ApiError(400, "Invalid Content-Length.")
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True  # the unread body would desync keep-alive
+            raise ApiError(413, "Request body too large.")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise ApiError(400, "Body must be valid JSON.")
+        if not isinstance(body, dict):
+            raise ApiError(400, "Body must be a JSON object.")
+        return body
+
+    def _current_user(self):
+        auth = self.headers.get("Authorization", "")
+        token = auth[7:].strip() if auth.startswith("Bearer ") else None
+        username = validate_session(token)
+        user = get_user(username) if username else None
+        if user is None:
+            raise ApiError(401, "Missing or invalid token.")
+        return user
+
+    def _dispatch(self, handler):
+        try:
+            handler(urlsplit(self.path))
+        except ApiError as e:
+            self._send_json(e.status, {"error": e.message})
+        except Exception:
+            logger.exception("API request failed: %s %s", self.command, self.path)
+            self._send_json(500, {"error": "Internal server error."})
+
+    def do_GET(self):
+        self._dispatch(self._handle_get)
+
+    def do_HEAD(self):
+        self._dispatch(self._handle_get)  # same headers, _send_raw leaves out the body
+
+    def do_POST(self):
+        self._dispatch(self._handle_post)
+
+    def do_DELETE(self):
+        self._dispatch(self._handle_delete)
+
+    # --- endpoints ---
+
+    def _handle_get(self, url):
+        if url.path == "/api/health":
+            self._send_json(200, {"status": "ok"})
+            return
+
+        user = self._current_user()
+        if url.path == "/api/routes":
+            routes = [route_to_json(d) for d in get_all_destinations(user_id=user['id'])]
+            self._send_json(200, {"routes": routes}, cacheable=True)
+            return
+
+        match = ROUTE_PATH.match(url.path)
+        if not match or match.group(2) not in ("latest", "history"):
+            raise ApiError(404, "Not found.")
+        dest = get_destination(int(match.group(1)), user['id'])
+        if dest is None:
+            raise ApiError(404, "Route not found.")
+
+        if match.group(2) == "latest":
+            latest = get_latest_price(dest['id'])
+            stats = get_route_stats(dest['id'])
+            self._send_json(200, {
+                "route": route_to_json(dest),
+                "price": latest['price'] if latest else None,
+                "checked_at": latest['checked_at'] if latest else None,
+                "stats": RouteStats(stats).summary() if stats else None,
+            }, cacheable=True)
+        else:
+            query = parse_qs(url.query)
+            try:
+                limit = min(int(query.get("limit", [HISTORY_DEFAULT_LIMIT])[0]), HISTORY_MAX_LIMIT)
+                cursor = int(query["cursor"][0]) if "cursor" in query else None
+            except ValueError:
+                raise ApiError(400, "limit and cursor must be integers.")
+            if limit < 1:
+                raise ApiError(400, "limit must be positive.")
+            items = get_price_history(dest['id'], limit=limit, before_id=cursor)
+            next_cursor = items[-1]['id'] if len(items) == limit else None
+            self._send_json(200, {"items": items, "next_cursor": next_cursor}, cacheable=True)
+
+    def _handle_post(self, url):
+        # Always consume the body first so errors don't leave it on a keep-alive connection
+        body = self._read_json()
+        if url.path == "/api/login":
+            username, password = body.get("username"), body.get("password")
+            if not isinstance(username, str) or not isinstance(password, str) or not username or not password:
+                raise ApiError(400, "username and password are required strings.")
+            ok, msg = authenticate_user(username, password)
+            if not ok:
+                raise ApiError(401, msg)
+            self._send_json(200, {"token": create_session(username)})
+            return
+
+        match = ROUTE_PATH.match(url.path)
+        if match and match.group(2) == "check":
+            self._check_route(int(match.group(1)))
+            return
+
+        if url.path != "/api/routes":
+            raise ApiError(404, "Not found.")
+        user = self._current_user()
+
+        airports = get_airports()
+        origin = str(body.get("origin", "")).upper()
+        destination = str(body.get("destination", "")).upper()
+        if origin not in airports or destination not in airports:
+            raise ApiError(400, "origin and destination must be known IATA codes.")
+        try:
+            target_price = float(body["target_price"])
+        except (KeyError, TypeError, ValueError):
+            raise ApiError(400, "target_price is required and must be a number.")
+        if not math.isfinite(target_price) or target_price <= 0:
+            raise ApiError(400, "target_price must be a positive number.")
+
+        try:
+            date_from = normalize_date(body.get("date_from"))
+            date_to = normalize_date(body.get("date_to"))
+        except ValueError:
+            raise ApiError(400, "date_from and date_to must be YYYY-MM-DD dates.")
+
+        new_id = add_destination(origin, destination, target_price, date_from, date_to, user_id=user['id'])
+        self._send_json(201, {"route": route_to_json(get_destination(new_id, user['id']))})
+
+    def _check_route(self, destination_id):
+        user = self._current_user()
+        dest = get_destination(destination_id, user['id'])
+        if dest is None:
+            raise ApiError(404, "Route not found.")
+        flight = check_route_now(dest)
+        self._send_json(200, {
+            "route": route_to_json(get_destination(destination_id, user['id'])),
+            "price": flight['price'] if flight else None,
+            "outbound_date": flight['outbound_date'] if flight else None,
+            "deep_link": flight['deep_link'] if flight else None,
+        })
+
+    def _handle_delete(self, url):
+        user = self._current_user()
+        match = ROUTE_PATH.match(url.path)
+        if not match or match.group(2) is not None:
+            raise ApiError(404, "Not found.")
+        if not delete_destination(int(match.group(1)), user['id']):
+            raise ApiError(404, "Route not found.")
+        self._send_raw(204, b"", {})
+
+
+def create_server(host=API_HOST, port=API_PORT):
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.daemon_threads = True
+    return server
+
+
+def start_api_server(host=API_HOST, port=API_PORT):
+    """Serves the API from a daemon thread. Returns the server (call shutdown() to stop)."""
+    server = create_server(host, port)
+    thread = threading.Thread(target=server.serve_forever, name="api-server", daemon=True)
+    thread.start()
+    logger.info("API listening on http://%s:%s", host, server.server_address[1])
+    return server
+
+
+if __name__ == "__main__":
+    from database import init_db
+    from log_config import setup_logging
+    setup_logging()
+    init_db()
+    server = create_server()
+    logger.info("API listening on http://%s:%s", API_HOST, API_PORT)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("API stopped.")
@@ -1,24 +1,31 @@
 import streamlit as st
-import pandas as pd
-import json
-from database import (init_db, get_all_destinations, add_destination, get_connection,
-                      get_setting, set_setting, create_user, authenticate_user, reset_password)
-from notifier import send_telegram_message
+from airports import get_airports, code_from_label
+from database import (init_db, get_all_destinations, add_destination, delete_destinations,
+                      query_destinations, count_destinations, get_destination_summary,
+                      get_setting, set_setting, create_user, authenticate_user, reset_password,
+                      create_session, validate_session, delete_session, get_user, set_user_chat_id,
+                      get_alert_rules, set_alert_rules, get_fare_calendar,
+                      add_anywhere_watch, get_anywhere_watches, delete_anywhere_watch, get_last_cycle)
 import os
-import secrets
 from dotenv import load_dotenv
 
-load_dotenv()
+# Heavy modules (pandas, requests via notifier) are imported where they are
+# used so the login page and cold reruns don't pay for them.
 
-# Load airport data
-with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'airports.json'), 'r') as f:
-    AIRPORTS = json.load(f)
-AIRPORT_OPTIONS = [f"{a['city']} - {a['name']} ({a['code']})" for a in AIRPORTS]
-AIRPORT_CODE_MAP = {f"{a['city']} - {a['name']} ({a['code']})": a['code'] for a in AIRPORTS}
+load_dotenv()
 
 # --- Page Config ---
 st.set_page_config(page_title="FlightHawk", page_icon="🦅", layout="wide")
-init_db()
+
+
+@st.cache_resource
+def bootstrap_db():
+    """Creates the schema once per process instead of on every rerun."""
+    init_db()
+    return True
+
+
+bootstrap_db()
 
 # --- Custom CSS ---
 st.markdown("""
@@ -326,8 +333,7 @@ def show_login():
                 if username and password:
                     ok, msg = authenticate_user(username, password)
                     if ok:
-                        token = secrets.token_hex(16)
-                        set_setting(f"session_{token}", username)
+                        token = create_session(username)
                         st.session_state["authenticated"] = True
                         st.session_state["username"] = username
                         st.query_params["token"] = token
@@ -378,6 +384,12 @@ def show_login():
 def show_dashboard():
     """Renders the main dashboard after authentication."""
 
+    user = get_user(st.session_state["username"])
+    if user is None:
+        # Account was removed while logged in
+        st.session_state["authenticated"] = False
+        st.rerun()
+
     # --- Header ---
     st.markdown("""
         <h1 style="margin-bottom: 0;">🦅 FlightHawk</h1>
@@ -389,10 +401,9 @@ def show_dashboard():
     st.write("")
 
     # --- Metrics Row ---
-    destinations = get_all_destinations()
-    total_tracked = len(destinations)
-    prices = [d['lowest_price_seen'] for d in destinations if d['lowest_price_seen'] is not None]
-    lowest_overall = f"${min(prices):,.0f}" if prices else "—"
+    summary = get_destination_summary(user['id'])
+    total_tracked = summary['count']
+    lowest_overall = f"${summary['best_price']:,.0f}" if summary['best_price'] is not None else "—"
     freq_minutes = int(get_setting('check_frequency_minutes') or 60)
     freq_display = f"{freq_minutes}min" if freq_minutes < 60 else f"{freq_minutes // 60}hr"
 
@@ -425,12 +436,15 @@ def show_dashboard():
     with st.expander("➕ Add New Route", expanded=False):
         st.markdown("<p style='font-size: 0.85rem; color: #9ca3af !important;'>Type to search by city or airport name</p>", unsafe_allow_html=True)
 
+        # Memory-mapped airports.bin, decoded once per process
+        airport_options = get_airports().labels()
+
         with st.form("add_destination_form"):
             col_from, col_to = st.columns(2)
             with col_from:
-                dep_selection = st.selectbox("From", options=[""] + AIRPORT_OPTIONS, index=0, placeholder="Type to search...")
+                dep_selection = st.selectbox("From", options=[""] + airport_options, index=0, placeholder="Type to search...")
             with col_to:
-                dest_selection = st.selectbox("To", options=[""] + AIRPORT_OPTIONS, index=0, placeholder="Type to search...")
+                dest_selection = st.selectbox("To", options=[""] + airport_options, index=0, placeholder="Type to search...")
 
             col_price, col_date1, col_date2 = st.columns([1, 1, 1])
             with col_price:
@@ -444,23 +458,96 @@ def show_dashboard():
 
             if submitted:
                 if dep_selection and dest_selection:
-                    dep_code = AIRPORT_CODE_MAP[dep_selection]
-                    dest_code = AIRPORT_CODE_MAP[dest_selection]
-                    d_from_str = date_from.strftime("%d/%m/%Y") if date_from else None
-                    d_to_str = date_to.strftime("%d/%m/%Y") if date_to else None
-                    add_destination(dep_code, dest_code, target_price, d_from_str, d_to_str)
-                    send_telegram_message(
+                    dep_code = code_from_label(dep_selection)
+                    dest_code = code_from_label(dest_selection)
+                    d_from_str = date_from.isoformat() if date_from else None
+                    d_to_str = date_to.isoformat() if date_to else None
+                    add_destination(dep_code, dest_code, target_price, d_from_str, d_to_str, user_id=user['id'])
+                    from notifier import send_telegram_message
+                    send_telegram_message(chat_id=user['telegram_chat_id'], message_text=(
                         f"🦅 <b>New Route Added</b>\n\n"
                         f"📍 {dep_code} ➡️ {dest_code}\n"
                         f"💰 Target: <b>${target_price:,.0f}</b>\n"
                         f"{f'📅 {d_from_str} — {d_to_str}' if d_from_str else '📅 Any date'}\n\n"
                         f"FlightHawk is now tracking this route!"
-                    )
+                    ))
                     st.success(f"Tracking {dep_selection} ➡️ {dest_selection} below ${target_price}")
                     st.rerun()
                 else:
                     st.error("Please select both airports.")
 
+    # --- Anywhere: one inspiration search per origin instead of one route per destination ---
+    with st.expander("🌍 Anywhere From…", expanded=False):
+        st.markdown("<p style='font-size: 0.85rem; color: #9ca3af !important;'>Every destination from one airport under your budget, in a single search per check</p>", unsafe_allow_html=True)
+        from refresh import cached_destinations, fetch_destinations, destinations_under_budget
+
+        with st.form("add_anywhere_form"):
+            col_origin, col_budget, col_date = st.columns([2, 1, 1])
+            with col_origin:
+                anywhere_origin = st.selectbox("From", options=[""] + get_airports().labels(), index=0,
+                                               placeholder="Type to search...", key="anywhere_origin")
+            with col_budget:
+                anywhere_budget = st.number_input("Budget ($)", min_value=1.0, value=300.0, step=10.0)
+            with col_date:
+                anywhere_date = st.date_input("Departure date", value=None, key="anywhere_date")
+            if st.form_submit_button("🌍 Watch Anywhere", use_container_width=True):
+                if anywhere_origin:
+                    add_anywhere_watch(user['id'], code_from_label(anywhere_origin), anywhere_budget,
+                                       anywhere_date.isoformat() if anywhere_date else None)
+                    st.rerun()
+                else:
+                    st.error("Please select an airport.")
+
+        for watch in get_anywhere_watches(user['id']):
+            when = watch['departure_date'] or "any date"
+            w1, w2, w3 = st.columns([3, 1, 1])
+            w1.markdown(f"**{watch['origin']} → anywhere** under ${watch['max_price']:,.0f} · {when}")
+            if w2.button("Search now", key=f"anywhere_search_{watch['id']}"):
+                with st.spinner("Searching destinations..."):
+                    fetch_destinations(watch['origin'], watch['departure_date'])
+            if w3.button("Remove", key=f"anywhere_remove_{watch['id']}"):
+                delete_anywhere_watch(watch['id'], user['id'])
+                st.rerun()
+            # Last stored result; the scheduler refreshes it every check
+            matches = destinations_under_budget(cached_destinations(watch['origin'], watch['departure_date']),
+                                                watch['max_price'])
+            if matches:
+                st.dataframe([{"Destination": m['name'], "Price ($)": m['price'], "Departure": m['departure_date']}
+                              for m in matches], use_container_width=True, hide_index=True)
+            else:
+                st.caption("No destinations under budget yet.")
+
+    # --- Bulk Import / Export ---
+    with st.expander("📦 Import / Export Routes", expanded=False):
+        st.markdown("<p style='font-size: 0.85rem; color: #9ca3af !important;'>CSV or JSON with origin, destination, target_price, date_from, date_to</p>", unsafe_allow_html=True)
+        from bulk import import_routes, export_routes, summary_message, MAX_REPORTED_ERRORS
+
+        uploaded = st.file_uploader("Import routes", type=["csv", "json"])
+        if uploaded is not None and st.button("📥 Import", use_container_width=True):
+            fmt = "json" if uploaded.name.lower().endswith(".json") else "csv"
+            try:
+                result = import_routes(uploaded.getvalue().decode("utf-8-sig"), fmt, user['id'])
+            except ValueError as e:
+                st.error(f"❌ Could not read file: {e}")
+            else:
+                if result['added']:
+                    from notifier import send_telegram_message
+                    send_telegram_message(summary_message(result), chat_id=user['telegram_chat_id'])
+                st.success(f"✅ Added {result['added']} routes ({result['duplicates']} already tracked)")
+                if result['errors']:
+                    st.warning("Skipped invalid rows:\n\n" + "\n\n".join(result['errors'][:MAX_REPORTED_ERRORS]))
+
+        # Built only on request so normal reruns don't serialize every route
+        if st.button("📤 Prepare Export", use_container_width=True):
+            destinations = get_all_destinations(user_id=user['id'])
+            col_csv, col_json = st.columns(2)
+            with col_csv:
+                st.download_button("⬇️ CSV", export_routes(destinations, "csv"), file_name="flighthawk_routes.csv",
+                                   mime="text/csv", use_container_width=True)
+            with col_json:
+                st.download_button("⬇️ JSON", export_routes(destinations, "json"), file_name="flighthawk_routes.json",
+                                   mime="application/json", use_container_width=True)
+
     # --- Sidebar: Settings & Logout ---
     with st.sidebar:
         st.markdown("<h2>⚙️ Settings</h2>", unsafe_allow_html=True)
@@ -488,11 +575,32 @@ def show_dashboard():
             st.success(f"✅ Updated to {selected_freq}")
             st.rerun()
 
+        profile_armed = get_setting('profile_next_cycle') == '1'
+        profile_next = st.toggle(
+            "Profile next check",
+            value=profile_armed,
+            help="Runs the next scheduled check under cProfile and tracemalloc; reports go to data/profiles/"
+        )
+        if profile_next != profile_armed:
+            set_setting('profile_next_cycle', '1' if profile_next else '0')
+            st.rerun()
+
+        chat_id = st.text_input(
+            "Telegram Chat ID",
+            value=user['telegram_chat_id'] or "",
+            placeholder="Uses the default chat if empty",
+            help="Send a message to @userinfobot on Telegram to find yours"
+        ).strip()
+        if chat_id != (user['telegram_chat_id'] or ""):
+            set_user_chat_id(user['id'], chat_id)
+            st.success("✅ Notifications will go to this chat")
+            st.rerun()
+
         st.write("---")
         if st.button("🚪 Logout", use_container_width=True):
             token = st.query_params.get("token")
             if token:
-                set_setting(f"session_{token}", "")  # invalidate
+                delete_session(token)
             st.session_state["authenticated"] = False
             st.query_params.clear()
             st.rerun()
@@ -500,42 +608,163 @@ def show_dashboard():
     # --- Main: Tracked Flights ---
     st.markdown("<h2>📋 Tracked Flights</h2>", unsafe_allow_html=True)
 
-    if destinations:
-        df = pd.DataFrame(destinations)
-        display_df = df.rename(columns={
-            "departure_city_code": "From",
-            "destination_city_code": "To",
-            "target_price": "Target ($)",
-            "lowest_price_seen": "Lowest ($)",
-            "date_from": "Earliest",
-            "date_to": "Latest"
-        })
-
-        display_cols = ["From", "To", "Target ($)", "Lowest ($)", "Earliest", "Latest"]
-        st.dataframe(
-            display_df[display_cols],
-            use_container_width=True,
-            hide_index=True,
-            column_config={
-                "Target ($)": st.column_config.NumberColumn(format="$%.0f"),
-                "Lowest ($)": st.column_config.NumberColumn(format="$%.0f"),
+    if total_tracked:
+        # Filtering, sorting and paging happen in SQL, so render cost is one page regardless of route count
+        f1, f2, f3, f4, f5 = st.columns([1, 1, 1.2, 1.2, 0.8])
+        with f1:
+            filter_from = st.text_input("From", placeholder="e.g. SFO", key="filter_from").strip()
+        with f2:
+            filter_to = st.text_input("To", placeholder="e.g. KEF", key="filter_to").strip()
+        with f3:
+            status_options = {
+                "All routes": {},
+                "Active": {"archived": False},
+                "Under target": {"under_target": True},
+                "Above target": {"under_target": False},
+                "Expired": {"archived": True},
             }
-        )
-
-        with st.expander("🗑️ Remove a tracked flight"):
-            id_to_delete = st.selectbox(
-                "Select route to remove",
-                df['id'].tolist(),
-                format_func=lambda x: f"{df[df['id']==x]['departure_city_code'].values[0]} → {df[df['id']==x]['destination_city_code'].values[0]}"
+            filter_status = st.selectbox("Status", list(status_options), key="filter_status")
+        with f4:
+            sort_labels = {
+                "Newest": ("id", True),
+                "Origin": ("origin", False),
+                "Destination": ("destination", False),
+                "Target price": ("target_price", False),
+                "Lowest price": ("lowest_price", False),
+                "Earliest date": ("date_from", False),
+            }
+            sort_choice = st.selectbox("Sort by", list(sort_labels), key="sort_by")
+        with f5:
+            page_size = st.selectbox("Per page", [25, 50, 100], key="page_size")
+
+        sort_col, descending = sort_labels[sort_choice]
+        filters = dict(origin=filter_from or None, destination=filter_to or None,
+                       **status_options[filter_status])
+        matching = count_destinations(user['id'], **filters)
+        page_count = max(1, -(-matching // page_size))
+        if st.session_state.get("route_page", 1) > page_count:
+            st.session_state["route_page"] = 1  # filters narrowed the result set
+        st.session_state.setdefault("route_page", 1)
+        page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, step=1,
+                               key="route_page")
+        rows = query_destinations(user['id'], sort=sort_col, descending=descending,
+                                  limit=page_size, offset=(page - 1) * page_size, **filters)
+
+        if rows:
+            import pandas as pd
+            df = pd.DataFrame(rows)
+            display_df = df.rename(columns={
+                "departure_city_code": "From",
+                "destination_city_code": "To",
+                "target_price": "Target ($)",
+                "lowest_price_seen": "Lowest ($)",
+                "date_from": "Earliest",
+                "date_to": "Latest"
+            })
+            display_df.insert(0, "Select", False)
+
+            # Streamlit keeps a fixed-size editor's ticks by row position for
+            # as long as its key stays the same, so the key covers everything
+            # that decides which routes are shown, and the selection is read
+            # back through the (hidden) id column rather than by position.
+            import hashlib
+            shown = repr((sorted(filters.items()), sort_choice, page, page_size, df["id"].tolist()))
+            table_key = "routes_table_" + hashlib.sha1(shown.encode()).hexdigest()[:16]
+
+            display_cols = ["Select", "id", "From", "To", "Target ($)", "Lowest ($)", "Earliest", "Latest"]
+            edited = st.data_editor(
+                display_df[display_cols],
+                use_container_width=True,
+                hide_index=True,
+                disabled=display_cols[1:],
+                column_config={
+                    "Select": st.column_config.CheckboxColumn(width="small"),
+                    "id": None,
+                    "Target ($)": st.column_config.NumberColumn(format="$%.0f"),
+                    "Lowest ($)": st.column_config.NumberColumn(format="$%.0f"),
+                },
+                key=table_key
             )
-            if st.button("Delete Route"):
-                conn = get_connection()
-                c = conn.cursor()
-                c.execute('DELETE FROM destinations WHERE id = ?', (id_to_delete,))
-                conn.commit()
-                conn.close()
-                st.success("Deleted!")
+            selected_ids = edited.loc[edited["Select"], "id"].tolist()
+            st.caption(f"{matching} matching route(s) · {len(selected_ids)} selected")
+
+            if st.button(f"🗑️ Delete Selected ({len(selected_ids)})", disabled=not selected_ids):
+                removed = delete_destinations(selected_ids, user['id'])
+                st.session_state.pop(table_key, None)
+                st.success(f"Deleted {removed} route(s)!")
                 st.rerun()
+
+            with st.expander("🔄 Check a route now"):
+                route_labels = {d['id']: f"{d['departure_city_code']} → {d['destination_city_code']}" for d in rows}
+                id_to_check = st.selectbox("Select route to check (current page)", list(route_labels),
+                                           format_func=route_labels.get)
+                if st.button("Check Now"):
+                    from refresh import check_route_now
+                    dest = next(d for d in rows if d['id'] == id_to_check)
+                    with st.spinner("Searching for the cheapest flight..."):
+                        flight = check_route_now(dest)
+                    if flight:
+                        st.success(f"{route_labels[id_to_check]}: ${flight['price']:,.0f} on {flight['outbound_date']}")
+                    else:
+                        st.info("No flights found for this route right now.")
+
+            with st.expander("🔔 Alert rules"):
+                from alerts import DEFAULT_RULES
+                route_labels = {d['id']: f"{d['departure_city_code']} → {d['destination_city_code']}" for d in rows}
+                id_to_configure = st.selectbox("Select route (current page)", list(route_labels),
+                                               format_func=route_labels.get, key="alert_route")
+                current = get_alert_rules([id_to_configure]).get(id_to_configure, DEFAULT_RULES)
+                with st.form("alert_rules_form"):
+                    use_target = st.checkbox("Price at or below my target", value="target" in current)
+                    below_avg = st.number_input("% below this route's average (0 = off)", min_value=0, max_value=90,
+                                                value=int(current.get("below_average") or 0))
+                    use_low = st.checkbox("New all-time low", value="all_time_low" in current)
+                    drop = st.number_input("% drop since last check (0 = off)", min_value=0, max_value=90,
+                                           value=int(current.get("drop_since_last") or 0))
+                    if st.form_submit_button("Save Rules"):
+                        rules = {}
+                        if use_target:
+                            rules["target"] = None
+                        if below_avg:
+                            rules["below_average"] = below_avg
+                        if use_low:
+                            rules["all_time_low"] = None
+                        if drop:
+                            rules["drop_since_last"] = drop
+                        set_alert_rules(id_to_configure, rules)
+                        if rules:
+                            st.success(f"Alert rules saved for {route_labels[id_to_configure]}.")
+                        else:
+                            st.success(f"Alerts turned off for {route_labels[id_to_configure]}.")
+
+            with st.expander("📅 Fare calendar"):
+                import datetime
+                import altair as alt
+                route_labels = {d['id']: f"{d['departure_city_code']} → {d['destination_city_code']}" for d in rows}
+                id_for_calendar = st.selectbox("Select route (current page)", list(route_labels),
+                                               format_func=route_labels.get, key="calendar_route")
+                # One range scan over the (route, departure date) primary key, upcoming days only
+                fares = get_fare_calendar(id_for_calendar, datetime.date.today().isoformat())
+                if fares:
+                    cal = pd.DataFrame(fares)
+                    dates = pd.to_datetime(cal["departure_date"])
+                    cal["Week of"] = (dates - pd.to_timedelta(dates.dt.weekday, unit="D")).dt.strftime("%d %b %Y")
+                    cal["Day"] = dates.dt.strftime("%a")
+                    cal["Checked"] = pd.to_datetime(cal["last_checked_at"], unit="s").dt.strftime("%d %b %H:%M")
+                    heatmap = alt.Chart(cal).mark_rect().encode(
+                        x=alt.X("Day:O", sort=["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"], title=None),
+                        y=alt.Y("Week of:O", sort=None, title=None),
+                        color=alt.Color("min_price:Q", title="Cheapest ($)", scale=alt.Scale(scheme="viridis", reverse=True)),
+                        tooltip=[alt.Tooltip("departure_date:N", title="Departure"),
+                                 alt.Tooltip("min_price:Q", title="Cheapest ($)", format=",.0f"),
+                                 alt.Tooltip("last_price:Q", title="Latest ($)", format=",.0f"),
+                                 alt.Tooltip("Checked:N", title="Last checked")],
+                    )
+                    st.altair_chart(heatmap, use_container_width=True)
+                else:
+                    st.info("No upcoming fares recorded for this route yet.")
+        else:
+            st.info("No routes match these filters.")
     else:
         st.markdown("""
             <div class="glass-card" style="text-align: center; padding: 48px;">
@@ -563,6 +792,32 @@ def show_dashboard():
         else:
             st.markdown('<p><span class="status-dot red"></span> Telegram bot token missing</p>', unsafe_allow_html=True)
 
+    cycle = get_last_cycle()
+    if cycle:
+        import datetime
+        fmt = lambda ts: datetime.datetime.fromtimestamp(ts).strftime("%d %b %H:%M")
+        if cycle['finished_at'] is None:
+            st.caption(f"🔄 Check in progress since {fmt(cycle['started_at'])}")
+        else:
+            next_due = cycle['started_at'] + int(get_setting('check_frequency_minutes') or 60) * 60
+            st.caption(f"Last check {fmt(cycle['started_at'])} · next check due {fmt(next_due)}")
+
+    from profiling import latest_summary
+    profile = latest_summary()
+    if profile:
+        import datetime
+        profiled_at = datetime.datetime.fromtimestamp(profile["started_at"]).strftime("%d %b %H:%M")
+        with st.expander(f"🩺 Last profiled check ({profiled_at})"):
+            p1, p2 = st.columns(2)
+            p1.metric("Duration", f"{profile['duration_seconds']:.2f} s")
+            p2.metric("Peak memory", f"{profile['peak_memory_kb'] / 1024:.1f} MiB")
+            if profile["error"]:
+                st.error(f"The profiled check failed: {profile['error']}")
+            st.markdown("**Hottest functions** (cumulative time)")
+            st.dataframe(profile["top_functions"][:10], use_container_width=True, hide_index=True)
+            st.markdown("**Top allocation sites**")
+            st.dataframe(profile["top_allocations"], use_container_width=True, hide_index=True)
+
 
 
 
@@ -574,7 +829,7 @@ def show_dashboard():
 if not st.session_state.get("authenticated"):
     token = st.query_params.get("token")
     if token:
-        stored_user = get_setting(f"session_{token}")
+        stored_user = validate_session(token)
         if stored_user:
             st.session_state["authenticated"] = True
             st.session_state["username"] = stored_user
@@ -1,9 +1,10 @@
 import random
 import time
 import os
-import requests
 from dotenv import load_dotenv
 
+import http_client
+
 load_dotenv()
 
 TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
@@ -33,14 +34,14 @@ def send_otp_via_telegram(otp_code):
     )
 
     try:
-        response = requests.post(url, json={
+        response = http_client.post(url, json={
             "chat_id": TELEGRAM_CHAT_ID,
             "text": msg,
             "parse_mode": "HTML"
         }, timeout=10)
         response.raise_for_status()
         return True
-    except requests.exceptions.RequestException:
+    except http_client.RequestException:
         return False
 
 
@@ -0,0 +1,246 @@
+"""
+Online SQLite backups and verified restores.
+
+Snapshots are taken with SQLite's online backup API a few pages at a time,
+sleeping between steps, so the scheduler, API and dashboard keep reading and
+writing while a backup runs. Each step only holds a read lock for as long as
+it takes to copy BACKUP_PAGES_PER_STEP pages; the longest such hold is
+reported along with the total duration. Writes from other connections make
+SQLite restart the copy; if that keeps happening, the copy finishes in one
+step instead (and that lock hold is what gets reported).
+
+Every snapshot is integrity-checked, gzip-compressed, timestamped and pruned
+to the newest BACKUP_KEEP files. Restores check the snapshot before copying
+it into the live database (again through the backup API, so open connections
+are safe) and check the result afterwards.
+
+    python backup.py                      # take a snapshot now
+    python backup.py --list               # list snapshots, newest first
+    python backup.py --verify FILE        # integrity-check a snapshot
+    python backup.py --restore FILE       # restore a snapshot into data/flights.db
+"""
+import glob
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+import database
+
+logger = logging.getLogger(__name__)
+
+BACKUP_DIR = os.environ.get("BACKUP_DIR", os.path.join(database.DATA_DIR, "backups"))
+BACKUP_KEEP = int(os.environ.get("BACKUP_KEEP", "7"))
+# Periodic snapshots from the scheduler process; 0 disables them
+BACKUP_INTERVAL_HOURS = float(os.environ.get("BACKUP_INTERVAL_HOURS", "0"))
+BACKUP_PAGES_PER_STEP = 64
+BACKUP_STEP_SLEEP = 0.005
+BACKUP_MAX_RESTARTS = 3
+SNAPSHOT_PREFIX = "flights-"
+SNAPSHOT_SUFFIX = ".db.gz"
+
+
+class BackupError(Exception):
+    pass
+
+
+class _Restarted(Exception):
+    pass
+
+
+def _copy_in_steps(source, target, pages_per_step, step_sleep, stats):
+    step_started = [time.perf_counter()]
+    last_remaining = [None]
+
+    def progress(status, remaining, total):
+        # Called right after each backup step, i.e. after the read lock was released
+        held = time.perf_counter() - step_started[0]
+        stats["steps"] += 1
+        stats["pages"] = total
+        stats["max_step"] = max(stats["max_step"], held)
+        if last_remaining[0] is not None and remaining > last_remaining[0]:
+            raise _Restarted()  # another connection wrote; SQLite restarted the copy
+        last_remaining[0] = remaining
+        if remaining:
+            time.sleep(step_sleep)  # let other connections in between steps
+        step_started[0] = time.perf_counter()
+
+    source.backup(target, pages=pages_per_step, progress=progress)
+
+
+def _copy_online(source, target, pages_per_step=BACKUP_PAGES_PER_STEP, step_sleep=BACKUP_STEP_SLEEP):
+    """
+    Copies source into target with the backup API in small steps.
+    A write from another connection makes SQLite start the copy over; after
+    BACKUP_MAX_RESTARTS of those the rest is copied in one step, holding the
+    read lock for the whole copy. Returns (steps, pages, longest lock hold in seconds, restarts).
+    """
+    stats = {"steps": 0, "pages": 0, "max_step": 0.0}
+    for restarts in range(BACKUP_MAX_RESTARTS + 1):
+        try:
+            _copy_in_steps(source, target, pages_per_step, step_sleep, stats)
+            return stats["steps"], stats["pages"], stats["max_step"], restarts
+        except _Restarted:
+            logger.info("Backup restarted by a concurrent write (%d/%d)", restarts + 1, BACKUP_MAX_RESTARTS)
+            time.sleep(step_sleep * 10)
+
+    started = time.perf_counter()
+    source.backup(target)
+    stats["max_step"] = max(stats["max_step"], time.perf_counter() - started)
+    return stats["steps"] + 1, stats["pages"], stats["max_step"], BACKUP_MAX_RESTARTS + 1
+
+
+def _integrity_check(path):
+    conn = sqlite3.connect(path)
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        conn.close()
+    if result != "ok":
+        raise BackupError(f"Integrity check failed for {path}: {result}")
+
+
+def _decompress(snapshot, target_dir):
+    fd, path = tempfile.mkstemp(suffix=".db", dir=target_dir)
+    with os.fdopen(fd, "wb") as out, gzip.open(snapshot, "rb") as src:
+        shutil.copyfileobj(src, out)
+    return path
+
+
+def list_snapshots(backup_dir=BACKUP_DIR):
+    """Snapshot paths, newest first."""
+    return sorted(glob.glob(os.path.join(backup_dir, f"{SNAPSHOT_PREFIX}*{SNAPSHOT_SUFFIX}")), reverse=True)
+
+
+def prune_snapshots(backup_dir=BACKUP_DIR, keep=BACKUP_KEEP):
+    """Deletes all but the newest `keep` snapshots. Returns the paths removed."""
+    removed = list_snapshots(backup_dir)[keep:]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def create_snapshot(backup_dir=BACKUP_DIR, db_path=None, keep=BACKUP_KEEP):
+    """
+    Takes a compressed snapshot of the live database without blocking other connections.
+    Returns a report dict (path, sizes, duration, longest lock hold).
+    """
+    db_path = db_path or database.DB_PATH
+    os.makedirs(backup_dir, exist_ok=True)
+    started = time.perf_counter()
+    fd, tmp_path = tempfile.mkstemp(suffix=".db", dir=backup_dir)
+    os.close(fd)
+    try:
+        source = sqlite3.connect(db_path)
+        target = sqlite3.connect(tmp_path)
+        try:
+            steps, pages, max_lock, restarts = _copy_online(source, target)
+        finally:
+            target.close()
+            source.close()
+        _integrity_check(tmp_path)
+
+        path = os.path.join(backup_dir, time.strftime(f"{SNAPSHOT_PREFIX}%Y%m%d-%H%M%S{SNAPSHOT_SUFFIX}"))
+        with open(tmp_path, "rb") as src, gzip.open(path + ".part", "wb", compresslevel=6) as out:
+            shutil.copyfileobj(src, out)
+        os.replace(path + ".part", path)
+        db_bytes = os.path.getsize(tmp_path)
+    finally:
+        os.remove(tmp_path)
+
+    pruned = prune_snapshots(backup_dir, keep)
+    report = {
+        "path": path,
+        "db_bytes": db_bytes,
+        "compressed_bytes": os.path.getsize(path),
+        "pages": pages,
+        "steps": steps,
+        "duration_seconds": round(time.perf_counter() - started, 3),
+        "max_lock_seconds": round(max_lock, 4),
+        "restarts": restarts,
+        "pruned": len(pruned),
+    }
+    logger.info("Backup %s: %d pages in %d steps, %.2fs total, longest lock %.1f ms, %d KiB compressed",
+                path, pages, steps, report["duration_seconds"], max_lock * 1000,
+                report["compressed_bytes"] // 1024)
+    return report
+
+
+def verify_snapshot(snapshot):
+    """Decompresses a snapshot to a temp file and integrity-checks it. Raises BackupError if damaged."""
+    tmp_path = _decompress(snapshot, os.path.dirname(os.path.abspath(snapshot)))
+    try:
+        _integrity_check(tmp_path)
+    finally:
+        os.remove(tmp_path)
+
+
+def restore_snapshot(snapshot, db_path=None):
+    """
+    Replaces the live database with a verified snapshot. The copy goes through the
+    backup API, so processes with the database open see a consistent switch.
+    """
+    db_path = db_path or database.DB_PATH
+    tmp_path = _decompress(snapshot, os.path.dirname(os.path.abspath(db_path)))
+    try:
+        _integrity_check(tmp_path)
+        source = sqlite3.connect(tmp_path)
+        target = sqlite3.connect(db_path, timeout=30)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+    finally:
+        os.remove(tmp_path)
+    _integrity_check(db_path)
+    database._session_cache.clear()
+    logger.info("Restored %s from %s", db_path, snapshot)
+
+
+def start_backup_scheduler(interval_hours=BACKUP_INTERVAL_HOURS):
+    """Takes a snapshot every interval_hours from a daemon thread. Returns the thread."""
+    def loop():
+        while True:
+            time.sleep(interval_hours * 3600)
+            try:
+                create_snapshot()
+            except Exception:
+                logger.exception("Scheduled backup failed")
+
+    thread = threading.Thread(target=loop, name="db-backup", daemon=True)
+    thread.start()
+    logger.info("Database snapshots every %g hour(s) to %s (keeping %d)", interval_hours, BACKUP_DIR, BACKUP_KEEP)
+    return thread
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Online backups of the FlightHawk database")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--list", action="store_true", help="list snapshots, newest first")
+    group.add_argument("--verify", metavar="FILE", help="integrity-check a snapshot")
+    group.add_argument("--restore", metavar="FILE", help="restore a snapshot into the live database")
+    args = parser.parse_args()
+
+    if args.list:
+        for path in list_snapshots():
+            print(f"{path}  {os.path.getsize(path) // 1024} KiB")
+    elif args.verify:
+        verify_snapshot(args.verify)
+        print(f"{args.verify}: ok")
+    elif args.restore:
+        restore_snapshot(args.restore)
+        print(f"Restored {database.DB_PATH} from {args.restore}")
+    else:
+        r = create_snapshot()
+        print(f"Snapshot: {r['path']}")
+        print(f"  {r['pages']} pages in {r['steps']} steps, {r['duration_seconds']:.2f}s, "
+              f"longest lock hold {r['max_lock_seconds'] * 1000:.1f} ms")
+        print(f"  {r['db_bytes'] // 1024} KiB -> {r['compressed_bytes'] // 1024} KiB compressed")
+        if r['pruned']:
+            print(f"  Pruned {r['pruned']} old snapshot(s)")
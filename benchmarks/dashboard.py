@@ -0,0 +1,242 @@
+"""
+Dashboard render benchmark: drives app.py headlessly with Streamlit's AppTest
+harness against seeded databases and measures each common interaction.
+
+For every database size (routes, with --history-rows price_history rows spread
+across them) a logged-in session runs this sequence, --samples times:
+
+    first_render   new session on a running server: token validation, metrics, forms, route table
+    rerun          same session, nothing changed
+    next_page      route table page 2
+    sort_lowest    sort by lowest price
+    page_size_100  100 routes per page
+    filter_origin  filter by an origin code
+
+and reports the median wall time per rerun, the SQL statements issued
+(counted with a trace callback on every database connection) and the peak
+Python memory allocated during the rerun (tracemalloc, measured in a
+separate pass so it doesn't skew the timings).
+
+Results are written as JSON; pass a previous file as --baseline to fail
+(exit 1) when an interaction got slower than --tolerance or issues more SQL:
+
+    python benchmarks/dashboard.py
+    python benchmarks/dashboard.py --sizes 10 1000 --baseline benchmarks/results/dashboard.json
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database  # noqa: E402
+
+APP_PATH = os.path.join(ROOT, "app.py")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+DEFAULT_DB_DIR = os.path.join(tempfile.gettempdir(), "flighthawk-bench")
+ORIGINS = ["SFO", "LAX", "JFK", "LHR", "CDG", "FRA", "AMS", "MAD", "NRT", "SYD"]
+DESTINATIONS = ["KEF", "DUB", "LIS", "BCN", "FCO", "ATH", "IST", "DXB", "SIN", "HND"]
+USERNAME = "bench"
+
+INTERACTIONS = [
+    ("first_render", None),
+    ("rerun", lambda at: None),
+    ("next_page", lambda at: at.number_input(key="route_page").set_value(2)),
+    ("sort_lowest", lambda at: at.selectbox(key="sort_by").select("Lowest price")),
+    ("page_size_100", lambda at: at.selectbox(key="page_size").select(100)),
+    ("filter_origin", lambda at: at.text_input(key="filter_from").input(ORIGINS[0])),
+]
+
+
+# ============================================================
+# SEEDING
+# ============================================================
+
+def seed_database(path, routes, history_rows):
+    """Creates a database with one user owning `routes` routes and `history_rows` price observations."""
+    database.DB_PATH = path
+    database.init_db()
+    database.create_user(USERNAME, "bench-password")
+    user_id = database.get_user(USERNAME)["id"]
+
+    rng = random.Random(routes)
+    rows = []
+    for i in range(routes):
+        target = rng.randrange(150, 1200, 10)
+        rows.append((ORIGINS[i % len(ORIGINS)], DESTINATIONS[(i // len(ORIGINS)) % len(DESTINATIONS)],
+                     target, f"2030-{1 + i % 12:02d}-{1 + i % 28:02d}", None))
+    database.add_destinations_bulk(rows, user_id)
+
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("UPDATE destinations SET lowest_price_seen = target_price * (0.7 + (id % 7) / 10.0)")
+        per_route = max(1, history_rows // routes)
+        conn.executemany(
+            "INSERT INTO price_history (destination_id, price, checked_at) VALUES (?, ?, datetime('now', ?))",
+            ((1 + n // per_route, 200 + rng.random() * 800, f"-{n % per_route} hours")
+             for n in range(per_route * routes)))
+    conn.close()
+
+
+def get_database(db_dir, routes, history_rows):
+    """Path of a seeded database, reusing one from an earlier run when the parameters match."""
+    os.makedirs(db_dir, exist_ok=True)
+    path = os.path.join(db_dir, f"dashboard-{routes}r-{history_rows}h.db")
+    if not os.path.exists(path):
+        started = time.perf_counter()
+        seed_database(path + ".part", routes, history_rows)
+        os.replace(path + ".part", path)
+        print(f"  seeded {os.path.basename(path)} in {time.perf_counter() - started:.1f}s")
+    return path
+
+
+# ============================================================
+# MEASUREMENT
+# ============================================================
+
+class StatementCounter:
+    """Counts SQL statements on every connection database.get_connection() hands out."""
+
+    def __init__(self):
+        self.count = 0
+        self._original = database.get_connection
+
+    def _connect(self):
+        conn = self._original()
+        conn.set_trace_callback(self._trace)
+        return conn
+
+    def _trace(self, statement):
+        self.count += 1
+
+    def install(self):
+        database.get_connection = self._connect
+
+    def uninstall(self):
+        database.get_connection = self._original
+
+
+def run_sequence(token, counter, track_memory=False):
+    """Runs every interaction once in a fresh session. Returns {name: (wall_ms, statements, peak_kib)}."""
+    from streamlit.testing.v1 import AppTest
+
+    database._session_cache.clear()  # a new session usually misses the in-process token cache
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at.query_params["token"] = token
+
+    results = {}
+    for name, action in INTERACTIONS:
+        if action is not None:
+            action(at)
+        counter.count = 0
+        if track_memory:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        at.run()
+        wall_ms = (time.perf_counter() - started) * 1000
+        peak_kib = (tracemalloc.get_traced_memory()[1] - base) / 1024 if track_memory else None
+        if at.exception:
+            raise RuntimeError(f"app.py raised during {name}: {at.exception[0].value}")
+        results[name] = (wall_ms, counter.count, peak_kib)
+    return results
+
+
+def benchmark(path, samples):
+    """Median wall time and statements over `samples` sequences, plus one tracemalloc pass."""
+    database.DB_PATH = path
+    token = database.create_session(USERNAME)
+    counter = StatementCounter()
+    counter.install()
+    try:
+        run_sequence(token, counter)  # warm-up: imports, airport index, page config
+        runs = [run_sequence(token, counter) for _ in range(samples)]
+        tracemalloc.start()
+        try:
+            memory = run_sequence(token, counter, track_memory=True)
+        finally:
+            tracemalloc.stop()
+    finally:
+        counter.uninstall()
+        database.delete_session(token)
+
+    return {
+        name: {
+            "wall_ms": round(statistics.median(run[name][0] for run in runs), 1),
+            "sql_statements": int(statistics.median(run[name][1] for run in runs)),
+            "peak_kib": round(memory[name][2], 1),
+        }
+        for name, _ in INTERACTIONS
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Lists regressions against a baseline results dict."""
+    regressions = []
+    for size, interactions in results["sizes"].items():
+        for name, now in interactions.items():
+            before = baseline.get("sizes", {}).get(size, {}).get(name)
+            if before is None:
+                continue
+            if now["wall_ms"] > before["wall_ms"] * (1 + tolerance):
+                regressions.append(f"{size} routes / {name}: {before['wall_ms']:.1f} -> {now['wall_ms']:.1f} ms")
+            if now["sql_statements"] > before["sql_statements"]:
+                regressions.append(f"{size} routes / {name}: {before['sql_statements']} -> "
+                                   f"{now['sql_statements']} SQL statements")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dashboard reruns against seeded databases")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000], help="route counts")
+    parser.add_argument("--history-rows", type=int, default=1_000_000)
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--db-dir", default=DEFAULT_DB_DIR, help="where seeded databases are kept between runs")
+    parser.add_argument("--output", default=os.path.join(RESULTS_DIR, "dashboard.json"))
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed wall-time slowdown (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    try:
+        import streamlit.testing.v1  # noqa: F401
+    except ImportError:
+        print("streamlit is not installed; nothing to benchmark")
+        sys.exit(2)
+
+    results = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "history_rows": args.history_rows,
+        "samples": args.samples,
+        "sizes": {},
+    }
+    for routes in args.sizes:
+        print(f"{routes} routes, {args.history_rows:,} history rows")
+        path = get_database(args.db_dir, routes, args.history_rows)
+        results["sizes"][str(routes)] = benchmark(path, args.samples)
+        for name, r in results["sizes"][str(routes)].items():
+            print(f"  {name:<14} {r['wall_ms']:8.1f} ms  {r['sql_statements']:4d} SQL  {r['peak_kib']:9.1f} KiB peak")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
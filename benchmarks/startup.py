@@ -0,0 +1,78 @@
+"""
+Cold-start budget check for the two entry points.
+
+Measures, in fresh interpreters so nothing is already cached:
+  - `import main`  (scheduler module, before any job runs)
+  - `import app`   is not measured directly: app.py is a Streamlit script, so
+    its first render is timed with Streamlit's headless AppTest harness.
+
+Exits non-zero when a measurement exceeds its budget, so it can gate a deploy:
+    python benchmarks/startup.py
+    python benchmarks/startup.py --main-budget-ms 150 --render-budget-ms 2000
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = (
+    "import time, sys; t = time.perf_counter(); import {module}; "
+    "print((time.perf_counter() - t) * 1000); "
+    "print(int(any(m in sys.modules for m in ('pandas', 'requests'))))"
+)
+
+RENDER_SNIPPET = (
+    "import time; from streamlit.testing.v1 import AppTest; "
+    "t = time.perf_counter(); at = AppTest.from_file('app.py', default_timeout=60).run(); "
+    "print((time.perf_counter() - t) * 1000); print(int(bool(at.exception)))"
+)
+
+
+def _run(snippet):
+    out = subprocess.run([sys.executable, "-c", snippet], cwd=ROOT, check=True,
+                         capture_output=True, text=True).stdout.split()
+    return float(out[0]), out[1] == "1"
+
+
+def measure(snippet, samples):
+    """Median wall time (ms) over fresh interpreters, plus the flag from the last run."""
+    results = [_run(snippet) for _ in range(samples)]
+    return statistics.median(r[0] for r in results), results[-1][1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check entry-point cold-start time against a budget")
+    parser.add_argument("--main-budget-ms", type=float, default=100.0)
+    parser.add_argument("--render-budget-ms", type=float, default=3000.0)
+    parser.add_argument("--samples", type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+
+    import_ms, heavy_loaded = measure(IMPORT_SNIPPET.format(module="main"), args.samples)
+    ok = import_ms <= args.main_budget_ms and not heavy_loaded
+    failed |= not ok
+    print(f"{'OK  ' if ok else 'FAIL'} import main          {import_ms:8.1f} ms  (budget {args.main_budget_ms:.0f} ms)")
+    if heavy_loaded:
+        print("     main.py pulled in pandas/requests at import time")
+
+    try:
+        import streamlit.testing.v1  # noqa: F401
+    except ImportError:
+        print("SKIP app.py first render (streamlit not installed)")
+    else:
+        render_ms, crashed = measure(RENDER_SNIPPET, args.samples)
+        ok = render_ms <= args.render_budget_ms and not crashed
+        failed |= not ok
+        print(f"{'OK  ' if ok else 'FAIL'} app.py first render  {render_ms:8.1f} ms  (budget {args.render_budget_ms:.0f} ms)")
+        if crashed:
+            print("     app.py raised an exception during the first render")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Bulk route import/export (CSV or JSON).
+
+Import validates every row against the airport index in one pass, drops rows
+that duplicate an existing route (or an earlier row in the same file), then
+inserts the rest in a single transaction.
+
+CSV columns / JSON keys: origin, destination, target_price, date_from, date_to
+(dates optional, YYYY-MM-DD or DD/MM/YYYY).
+"""
+import csv
+import io
+import json
+import math
+import sys
+import time
+from datetime import datetime
+
+from airports import get_airports
+from database import get_all_destinations, add_destinations_bulk
+
+FIELDS = ["origin", "destination", "target_price", "date_from", "date_to"]
+DB_DATE_FORMAT = "%Y-%m-%d"
+INPUT_DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y")
+MAX_REPORTED_ERRORS = 50
+
+
+def normalize_date(value):
+    """Parses an input date into the format stored in the database (None if blank)."""
+    value = str(value or "").strip()
+    if not value:
+        return None
+    for fmt in INPUT_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).strftime(DB_DATE_FORMAT)
+        except ValueError:
+            continue
+    raise ValueError(f"invalid date '{value}'")
+
+
+def parse_routes(data, fmt):
+    """Reads raw CSV/JSON text into a list of dicts keyed by FIELDS."""
+    if fmt == "json":
+        rows = json.loads(data)
+        if isinstance(rows, dict):
+            rows = rows.get("routes", [])
+        if not isinstance(rows, list):
+            raise ValueError("JSON import must be a list of routes")
+        return rows
+    if fmt == "csv":
+        try:
+            return list(csv.DictReader(io.StringIO(data)))
+        except csv.Error as e:
+            raise ValueError(f"malformed CSV: {e}")
+    raise ValueError(f"Unsupported format: {fmt}")
+
+
+def _route_key(dep, dest, d_from, d_to):
+    return (dep, dest, d_from, d_to)
+
+
+def import_routes(data, fmt, user_id):
+    """
+    Imports routes for a user. Returns {"added", "duplicates", "errors"} where
+    errors is a list of "row N: reason" strings (row 1 is the first data row).
+    """
+    airports = get_airports()
+    existing = {
+        _route_key(d['departure_city_code'], d['destination_city_code'], d['date_from'], d['date_to'])
+        for d in get_all_destinations(user_id=user_id)
+    }
+
+    to_insert = []
+    duplicates = 0
+    errors = []
+    for n, row in enumerate(parse_routes(data, fmt), start=1):
+        try:
+            dep = str(row.get("origin") or "").strip().upper()
+            dest = str(row.get("destination") or "").strip().upper()
+            if dep not in airports:
+                raise ValueError(f"unknown origin '{dep}'")
+            if dest not in airports:
+                raise ValueError(f"unknown destination '{dest}'")
+            try:
+                price = float(row.get("target_price"))
+            except (TypeError, ValueError):
+                raise ValueError("target_price must be a number")
+            if not math.isfinite(price) or price <= 0:
+                raise ValueError("target_price must be a positive number")
+            d_from = normalize_date(row.get("date_from"))
+            d_to = normalize_date(row.get("date_to"))
+        except (ValueError, AttributeError) as e:
+            errors.append(f"row {n}: {e}")
+            continue
+
+        key = _route_key(dep, dest, d_from, d_to)
+        if key in existing:
+            duplicates += 1
+            continue
+        existing.add(key)
+        to_insert.append((dep, dest, price, d_from, d_to))
+
+    added = add_destinations_bulk(to_insert, user_id) if to_insert else 0
+    return {"added": added, "duplicates": duplicates, "errors": errors}
+
+
+def export_routes(destinations, fmt):
+    """Serializes routes (rows from get_all_destinations) as CSV or JSON text importable by import_routes."""
+    rows = [{
+        "origin": d['departure_city_code'],
+        "destination": d['destination_city_code'],
+        "target_price": d['target_price'],
+        "date_from": d['date_from'] or "",
+        "date_to": d['date_to'] or "",
+    } for d in destinations]
+
+    if fmt == "json":
+        return json.dumps(rows, indent=2)
+    if fmt == "csv":
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+        return out.getvalue()
+    raise ValueError(f"Unsupported format: {fmt}")
+
+
+def summary_message(result):
+    """One Telegram message summarizing an import."""
+    msg = (
+        f"🦅 <b>Routes Imported</b>\n\n"
+        f"✅ Added: <b>{result['added']}</b>\n"
+        f"♻️ Already tracked: {result['duplicates']}\n"
+    )
+    if result['errors']:
+        msg += f"⚠️ Skipped (invalid): {len(result['errors'])}\n"
+    return msg + "\nFlightHawk is now tracking these routes!"
+
+
+if __name__ == "__main__":
+    # Import benchmark: python bulk.py 10000
+    import os
+    import tempfile
+    import database
+
+    database.DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.db")
+    database.init_db()
+    database.create_user("bench", "bench")
+    user_id = database.get_user("bench")['id']
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    codes = [a['code'] for a in get_airports()][:200]
+    first_day = datetime(2030, 1, 1).toordinal()
+    csv_text = "origin,destination,target_price,date_from,date_to\n" + "".join(
+        f"{codes[i % 200]},{codes[(i + 1) % 200]},{100 + i % 500},"
+        f"{datetime.fromordinal(first_day + i).strftime('%Y-%m-%d')},\n"
+        for i in range(n)
+    )
+
+    start = time.perf_counter()
+    result = import_routes(csv_text, "csv", user_id)
+    print(f"Imported {n} rows in {time.perf_counter() - start:.2f}s: "
+          f"{result['added']} added, {result['duplicates']} duplicates, {len(result['errors'])} errors")
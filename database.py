@@ -1,12 +1,23 @@
 import sqlite3
 import os
+import json
+import time
 import hashlib
 import secrets
+import threading
+from collections import OrderedDict
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
 os.makedirs(DATA_DIR, exist_ok=True)
 DB_PATH = os.path.join(DATA_DIR, 'flights.db')
 
+SESSION_TTL_SECONDS = 7 * 24 * 3600      # sliding login lifetime
+SESSION_CACHE_TTL_SECONDS = 30           # how long a validated token is trusted in-process
+SESSION_CACHE_SIZE = 1024
+
+# A route's last travel date for comparisons; open-ended windows never end
+WINDOW_END_SQL = "IFNULL(date_to, '9999-12-31')"
+
 def get_connection():
     return sqlite3.connect(DB_PATH)
 
@@ -32,7 +43,8 @@ def init_db():
             date_from TEXT,
             date_to TEXT,
             nights_in_dst_from INTEGER DEFAULT 1,
-            nights_in_dst_to INTEGER DEFAULT 14
+            nights_in_dst_to INTEGER DEFAULT 14,
+            user_id INTEGER REFERENCES users(id)
         )
     ''')
     
@@ -59,39 +71,361 @@ def init_db():
             username TEXT UNIQUE NOT NULL,
             password_hash TEXT NOT NULL,
             password_salt TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            telegram_chat_id TEXT
+        )
+    ''')
+    
+    # Columns added after the first release
+    _add_column_if_missing(c, 'destinations', 'user_id', 'INTEGER REFERENCES users(id)')
+    _add_column_if_missing(c, 'users', 'telegram_chat_id', 'TEXT')
+    _add_column_if_missing(c, 'destinations', 'last_checked_at', 'REAL')
+    _add_column_if_missing(c, 'destinations', 'last_cycle_id', 'INTEGER')
+    _add_column_if_missing(c, 'destinations', 'archived_at', 'REAL')
+    _add_column_if_missing(c, 'destinations', 'last_observed_at', 'REAL')
+    _migrate_iso_dates(c)
+    c.execute('CREATE INDEX IF NOT EXISTS idx_destinations_user_id ON destinations(user_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_destinations_user_origin ON destinations(user_id, departure_city_code)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_destinations_user_dest ON destinations(user_id, destination_city_code)')
+    # Scheduler selection: routes not archived whose travel window is still open. An open-ended
+    # window (date_to NULL) sorts last, so the range condition needs no OR and uses the index.
+    c.execute('DROP INDEX IF EXISTS idx_destinations_open')
+    c.execute(f"CREATE INDEX IF NOT EXISTS idx_destinations_window ON destinations(archived_at, {WINDOW_END_SQL})")
+    c.execute('CREATE INDEX IF NOT EXISTS idx_price_history_destination ON price_history(destination_id, id)')
+    
+    # Streaming price statistics per route (see price_stats.py)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS route_stats (
+            destination_id INTEGER PRIMARY KEY,
+            state TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            FOREIGN KEY(destination_id) REFERENCES destinations(id) ON DELETE CASCADE
+        )
+    ''')
+    
+    # Per-route alert rules (see alerts.py); routes without rows use the default target rule
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS alert_rules (
+            destination_id INTEGER NOT NULL,
+            rule TEXT NOT NULL,
+            threshold REAL,
+            PRIMARY KEY (destination_id, rule),
+            FOREIGN KEY(destination_id) REFERENCES destinations(id) ON DELETE CASCADE
+        )
+    ''')
+    
+    # Cheapest fare per route and departure day, upserted as search results land
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS fare_calendar (
+            destination_id INTEGER NOT NULL,
+            departure_date TEXT NOT NULL,
+            min_price REAL NOT NULL,
+            min_observed_at REAL NOT NULL,
+            last_price REAL NOT NULL,
+            last_checked_at REAL NOT NULL,
+            PRIMARY KEY (destination_id, departure_date),
+            FOREIGN KEY(destination_id) REFERENCES destinations(id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_fare_calendar_date ON fare_calendar(departure_date)')
+    
+    # Origin-only "anywhere" watches: one inspiration search per origin finds destinations under budget
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS anywhere_watches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            origin TEXT NOT NULL,
+            max_price REAL NOT NULL,
+            departure_date TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_anywhere_watches_user ON anywhere_watches(user_id)')
+    
+    # Scheduler cycle checkpoints: a restart resumes the open cycle instead of starting over
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS cycles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at REAL NOT NULL,
+            interval_seconds INTEGER NOT NULL,
+            anywhere_done INTEGER NOT NULL DEFAULT 0,
+            finished_at REAL,
+            next_due REAL
+        )
+    ''')
+    # Route observations waiting for the end-of-cycle rule evaluation, saved with
+    # the route's checkpoint, and rendered notifications waiting to be sent
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS cycle_observations (
+            cycle_id INTEGER NOT NULL,
+            destination_id INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            PRIMARY KEY (cycle_id, destination_id)
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id TEXT,
+            message TEXT NOT NULL,
+            queued_at REAL NOT NULL
+        )
+    ''')
+    
+    # Shared flight-search results, keyed by search parameters (see refresh.py)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS search_cache (
+            key TEXT PRIMARY KEY,
+            result TEXT,
+            fetched_at REAL,
+            lease_until REAL
+        )
+    ''')
+    # Routes created before ownership existed belong to the first account
+    c.execute('''
+        UPDATE destinations SET user_id = (SELECT MIN(id) FROM users)
+        WHERE user_id IS NULL AND EXISTS (SELECT 1 FROM users)
+    ''')
+    
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            token TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            last_seen INTEGER NOT NULL,
+            ttl_seconds INTEGER NOT NULL,
+            expires_at INTEGER NOT NULL,
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id)')
     
     c.execute('''
         INSERT OR IGNORE INTO settings (key, value) VALUES ('check_frequency_minutes', '60')
     ''')
     
+    _migrate_settings_sessions(c)
+    
     conn.commit()
     conn.close()
 
-def add_destination(dep_code, dest_code, target_price, date_from=None, date_to=None):
-    """Adds a new destination to track."""
+def _add_column_if_missing(c, table, column, definition):
+    """ALTER TABLE ... ADD COLUMN for databases created by an older schema."""
+    c.execute(f'PRAGMA table_info({table})')
+    if column not in {row[1] for row in c.fetchall()}:
+        c.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def _migrate_iso_dates(c):
+    """Rewrites legacy DD/MM/YYYY route dates as YYYY-MM-DD, which sort and compare as text."""
+    for column in ('date_from', 'date_to'):
+        c.execute(f'''
+            UPDATE destinations
+            SET {column} = substr({column}, 7, 4) || '-' || substr({column}, 4, 2) || '-' || substr({column}, 1, 2)
+            WHERE {column} LIKE '__/__/____'
+        ''')
+        c.execute(f"UPDATE destinations SET {column} = NULL WHERE {column} = ''")
+
+def _migrate_settings_sessions(c):
+    """Moves legacy `session_<token>` rows out of settings into the sessions table."""
+    c.execute("SELECT key, value FROM settings WHERE key LIKE 'session\\_%' ESCAPE '\\'")
+    legacy = c.fetchall()
+    if not legacy:
+        return
+    now = int(time.time())
+    for key, username in legacy:
+        if not username:
+            continue  # logged out under the old scheme
+        c.execute('''
+            INSERT OR IGNORE INTO sessions (token, user_id, created_at, last_seen, ttl_seconds, expires_at)
+            SELECT ?, id, ?, ?, ?, ? FROM users WHERE username = ?
+        ''', (key[len('session_'):], now, now, SESSION_TTL_SECONDS, now + SESSION_TTL_SECONDS,
+              username.lower()))
+    c.execute("DELETE FROM settings WHERE key LIKE 'session\\_%' ESCAPE '\\'")
+
+def add_destination(dep_code, dest_code, target_price, date_from=None, date_to=None, user_id=None):
+    """Adds a new destination to track, owned by user_id (dates are YYYY-MM-DD). Returns the new route id."""
     conn = get_connection()
     c = conn.cursor()
     c.execute('''
         INSERT INTO destinations 
-        (departure_city_code, destination_city_code, target_price, date_from, date_to) 
-        VALUES (?, ?, ?, ?, ?)
-    ''', (dep_code.upper(), dest_code.upper(), target_price, date_from, date_to))
+        (departure_city_code, destination_city_code, target_price, date_from, date_to, user_id) 
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (dep_code.upper(), dest_code.upper(), target_price, date_from, date_to, user_id))
+    new_id = c.lastrowid
     conn.commit()
     conn.close()
+    return new_id
 
-def get_all_destinations():
-    """Fetches all tracked destinations."""
+def get_all_destinations(user_id=None):
+    """Fetches tracked destinations — every route, or only those owned by user_id."""
     conn = get_connection()
     conn.row_factory = sqlite3.Row 
     c = conn.cursor()
-    c.execute('SELECT * FROM destinations')
+    if user_id is None:
+        c.execute('SELECT * FROM destinations')
+    else:
+        c.execute('SELECT * FROM destinations WHERE user_id = ?', (user_id,))
     rows = c.fetchall()
     conn.close()
     return [dict(row) for row in rows]
 
+def get_active_destinations(today=None):
+    """Routes the scheduler should search: not archived, with a travel window that hasn't ended."""
+    today = today or time.strftime('%Y-%m-%d')
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    c.execute(f'''
+        SELECT * FROM destinations
+        WHERE archived_at IS NULL AND {WINDOW_END_SQL} >= ?
+    ''', (today,))
+    rows = c.fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def archive_expired_routes(today=None):
+    """Archives routes whose latest travel date has passed. Returns the archived rows."""
+    today = today or time.strftime('%Y-%m-%d')
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    with conn:
+        rows = conn.execute(f'''
+            SELECT * FROM destinations WHERE archived_at IS NULL AND {WINDOW_END_SQL} < ?
+        ''', (today,)).fetchall()
+        conn.executemany('UPDATE destinations SET archived_at = ? WHERE id = ?',
+                         [(time.time(), row['id']) for row in rows])
+    conn.close()
+    return [dict(row) for row in rows]
+
+def add_destinations_bulk(rows, user_id):
+    """
+    Inserts many routes in a single transaction.
+    rows: iterable of (dep_code, dest_code, target_price, date_from, date_to). Returns the count inserted.
+    """
+    params = [(dep.upper(), dest.upper(), price, d_from, d_to, user_id)
+              for dep, dest, price, d_from, d_to in rows]
+    conn = get_connection()
+    with conn:
+        conn.executemany('''
+            INSERT INTO destinations
+            (departure_city_code, destination_city_code, target_price, date_from, date_to, user_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', params)
+    conn.close()
+    return len(params)
+
+def get_destination(destination_id, user_id):
+    """Fetches one route if it belongs to user_id, else None."""
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    c.execute('SELECT * FROM destinations WHERE id = ? AND user_id = ?', (destination_id, user_id))
+    row = c.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+# Columns the dashboard table may sort by (whitelist: these are interpolated into SQL)
+DESTINATION_SORT_COLUMNS = {
+    "id": "id",
+    "origin": "departure_city_code",
+    "destination": "destination_city_code",
+    "target_price": "target_price",
+    "lowest_price": "lowest_price_seen",
+    "date_from": "date_from",
+}
+
+def _destination_filters(user_id, origin=None, destination=None, under_target=None, archived=None):
+    """Builds the WHERE clause shared by query_destinations and count_destinations."""
+    where = ["user_id = ?"]
+    params = [user_id]
+    if origin:
+        where.append("departure_city_code = ?")
+        params.append(origin.upper())
+    if destination:
+        where.append("destination_city_code = ?")
+        params.append(destination.upper())
+    if under_target is True:
+        where.append("lowest_price_seen <= target_price")
+    elif under_target is False:
+        where.append("(lowest_price_seen IS NULL OR lowest_price_seen > target_price)")
+    if archived is True:
+        where.append("archived_at IS NOT NULL")
+    elif archived is False:
+        where.append("archived_at IS NULL")
+    return " AND ".join(where), params
+
+def count_destinations(user_id, origin=None, destination=None, under_target=None, archived=None):
+    """Number of a user's routes matching the dashboard filters."""
+    where_sql, params = _destination_filters(user_id, origin, destination, under_target, archived)
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute(f'SELECT COUNT(*) FROM destinations WHERE {where_sql}', params)
+    total = c.fetchone()[0]
+    conn.close()
+    return total
+
+def query_destinations(user_id, origin=None, destination=None, under_target=None, archived=None,
+                       sort="id", descending=False, limit=25, offset=0):
+    """
+    One page of a user's routes, filtered and sorted in SQL.
+    under_target: True = lowest seen at/below target, False = above target or never priced.
+    archived: True = expired routes only, False = active routes only.
+    """
+    where_sql, params = _destination_filters(user_id, origin, destination, under_target, archived)
+    order_col = DESTINATION_SORT_COLUMNS.get(sort, "id")
+    direction = "DESC" if descending else "ASC"
+
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    c.execute(f'''
+        SELECT * FROM destinations WHERE {where_sql}
+        ORDER BY {order_col} {direction}, id {direction} LIMIT ? OFFSET ?
+    ''', params + [limit, offset])
+    rows = [dict(row) for row in c.fetchall()]
+    conn.close()
+    return rows
+
+def get_destination_summary(user_id):
+    """Route count and best price for a user's dashboard metrics, computed in SQL."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('SELECT COUNT(*), MIN(lowest_price_seen) FROM destinations WHERE user_id = ?', (user_id,))
+    count, best = c.fetchone()
+    conn.close()
+    return {"count": count, "best_price": best}
+
+def delete_destinations(destination_ids, user_id):
+    """Deletes several of a user's routes by primary key in one transaction. Returns the count removed."""
+    params = [(int(i), user_id) for i in destination_ids]
+    conn = get_connection()
+    with conn:
+        before = conn.total_changes
+        conn.executemany('DELETE FROM destinations WHERE id = ? AND user_id = ?', params)
+        deleted = conn.total_changes - before
+        for table in ('route_stats', 'alert_rules', 'fare_calendar'):
+            conn.executemany(f'''
+                DELETE FROM {table}
+                WHERE destination_id = ? AND NOT EXISTS (SELECT 1 FROM destinations WHERE id = ?)
+            ''', [(i, i) for i, _ in params])
+    conn.close()
+    return deleted
+
+def delete_destination(destination_id, user_id):
+    """Deletes a route if it belongs to user_id. Returns True if a row was removed."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('DELETE FROM destinations WHERE id = ? AND user_id = ?', (destination_id, user_id))
+    deleted = c.rowcount == 1
+    if deleted:
+        c.execute('DELETE FROM route_stats WHERE destination_id = ?', (destination_id,))
+        c.execute('DELETE FROM alert_rules WHERE destination_id = ?', (destination_id,))
+        c.execute('DELETE FROM fare_calendar WHERE destination_id = ?', (destination_id,))
+    conn.commit()
+    conn.close()
+    return deleted
+
 def update_lowest_price(destination_id, new_lowest_price):
     """Updates the lowest price seen."""
     conn = get_connection()
@@ -101,6 +435,249 @@ def update_lowest_price(destination_id, new_lowest_price):
     conn.commit()
     conn.close()
 
+def record_price(destination_id, price, observed_at=None):
+    """
+    Appends an observation to price_history; observed_at is when the quote was fetched.
+    Returns False (recording nothing) if a quote at least that recent is already recorded.
+    """
+    observed_at = observed_at or time.time()
+    conn = get_connection()
+    with conn:
+        # Check and claim in one statement, so two checks served the same cached quote can't both record it
+        claimed = conn.execute('''
+            UPDATE destinations SET last_observed_at = ?
+            WHERE id = ? AND (last_observed_at IS NULL OR last_observed_at < ?)
+        ''', (observed_at, destination_id, observed_at)).rowcount
+        if claimed:
+            conn.execute('INSERT INTO price_history (destination_id, price) VALUES (?, ?)', (destination_id, price))
+    conn.close()
+    return bool(claimed)
+
+def get_latest_price(destination_id):
+    """Most recent price_history row for a route, or None."""
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    c.execute('''
+        SELECT id, price, checked_at FROM price_history
+        WHERE destination_id = ? ORDER BY id DESC LIMIT 1
+    ''', (destination_id,))
+    row = c.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def get_price_history(destination_id, limit=50, before_id=None):
+    """
+    One page of price_history for a route, newest first.
+    Keyset pagination: pass the last row's id as before_id to get the next page.
+    """
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    if before_id is None:
+        c.execute('''
+            SELECT id, price, checked_at FROM price_history
+            WHERE destination_id = ? ORDER BY id DESC LIMIT ?
+        ''', (destination_id, limit))
+    else:
+        c.execute('''
+            SELECT id, price, checked_at FROM price_history
+            WHERE destination_id = ? AND id < ? ORDER BY id DESC LIMIT ?
+        ''', (destination_id, before_id, limit))
+    rows = c.fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def get_route_stats(destination_id):
+    """Returns the persisted statistics state for a route, or None."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('SELECT state FROM route_stats WHERE destination_id = ?', (destination_id,))
+    row = c.fetchone()
+    conn.close()
+    return json.loads(row[0]) if row else None
+
+def save_route_stats(destination_id, state):
+    """Persists a route's statistics state (a JSON-serializable dict)."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('INSERT OR REPLACE INTO route_stats (destination_id, state, updated_at) VALUES (?, ?, ?)',
+              (destination_id, json.dumps(state, separators=(',', ':')), time.time()))
+    conn.commit()
+    conn.close()
+
+# Marker row for a route whose alert rules were all turned off (no rows means "use the defaults")
+ALERTS_OFF_RULE = 'none'
+
+def get_alert_rules(destination_ids=None):
+    """
+    Configured alert rules as {destination_id: {rule: threshold}}.
+    Routes without configured rules are absent (they use alerts.DEFAULT_RULES);
+    routes with every rule turned off map to {}.
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    if destination_ids is None:
+        c.execute('SELECT destination_id, rule, threshold FROM alert_rules')
+    else:
+        ids = [int(i) for i in destination_ids]
+        c.execute(f'''
+            SELECT destination_id, rule, threshold FROM alert_rules
+            WHERE destination_id IN ({','.join('?' * len(ids))})
+        ''', ids)
+    rules = {}
+    for destination_id, rule, threshold in c.fetchall():
+        route_rules = rules.setdefault(destination_id, {})
+        if rule != ALERTS_OFF_RULE:
+            route_rules[rule] = threshold
+    conn.close()
+    return rules
+
+def set_alert_rules(destination_id, rules):
+    """Replaces a route's alert rules with rules ({rule: threshold or None}); {} turns alerts off."""
+    rows = [(destination_id, rule, threshold) for rule, threshold in rules.items()]
+    conn = get_connection()
+    with conn:
+        conn.execute('DELETE FROM alert_rules WHERE destination_id = ?', (destination_id,))
+        conn.executemany('INSERT INTO alert_rules (destination_id, rule, threshold) VALUES (?, ?, ?)',
+                         rows or [(destination_id, ALERTS_OFF_RULE, None)])
+    conn.close()
+
+def add_anywhere_watch(user_id, origin, max_price, departure_date=None):
+    """Watches every destination from origin under max_price (departure_date YYYY-MM-DD or None). Returns the id."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('INSERT INTO anywhere_watches (user_id, origin, max_price, departure_date) VALUES (?, ?, ?, ?)',
+              (user_id, origin.upper(), max_price, departure_date))
+    watch_id = c.lastrowid
+    conn.commit()
+    conn.close()
+    return watch_id
+
+def get_anywhere_watches(user_id=None):
+    """All "anywhere" watches, or one user's."""
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    if user_id is None:
+        c.execute('SELECT * FROM anywhere_watches ORDER BY origin, departure_date')
+    else:
+        c.execute('SELECT * FROM anywhere_watches WHERE user_id = ? ORDER BY id', (user_id,))
+    rows = c.fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def delete_anywhere_watch(watch_id, user_id):
+    """Deletes a watch if it belongs to user_id. Returns True if a row was removed."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('DELETE FROM anywhere_watches WHERE id = ? AND user_id = ?', (watch_id, user_id))
+    deleted = c.rowcount == 1
+    conn.commit()
+    conn.close()
+    return deleted
+
+def upsert_fare(destination_id, departure_date, price, observed_at=None):
+    """
+    Folds one search result into the fare calendar (departure_date is YYYY-MM-DD).
+    Keeps the cheapest price seen for that day and when it was seen, plus the latest check.
+    """
+    upsert_fares(destination_id, [(departure_date, price)], observed_at)
+
+def upsert_fares(destination_id, fares, observed_at=None):
+    """Folds several (departure_date, price) results for one route into the fare calendar in one transaction."""
+    observed_at = observed_at or time.time()
+    conn = get_connection()
+    with conn:
+        conn.executemany('''
+            INSERT INTO fare_calendar (destination_id, departure_date, min_price, min_observed_at,
+                                       last_price, last_checked_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (destination_id, departure_date) DO UPDATE SET
+                min_observed_at = CASE WHEN excluded.min_price <= min_price
+                                       THEN excluded.min_observed_at ELSE min_observed_at END,
+                min_price = MIN(min_price, excluded.min_price),
+                last_price = excluded.last_price,
+                last_checked_at = excluded.last_checked_at
+        ''', [(destination_id, day, price, observed_at, price, observed_at) for day, price in fares])
+    conn.close()
+
+def get_fare_calendar(destination_id, start_date, end_date=None):
+    """Fare calendar rows for a route from start_date (inclusive) to end_date (inclusive), by date."""
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    c.execute('''
+        SELECT departure_date, min_price, min_observed_at, last_price, last_checked_at
+        FROM fare_calendar
+        WHERE destination_id = ? AND departure_date >= ? AND departure_date <= ?
+        ORDER BY departure_date
+    ''', (destination_id, start_date, end_date or '9999-12-31'))
+    rows = c.fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def prune_fare_calendar(today=None):
+    """Deletes fare calendar days that have already departed. Returns the number removed."""
+    today = today or time.strftime('%Y-%m-%d')
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('DELETE FROM fare_calendar WHERE departure_date < ?', (today,))
+    removed = c.rowcount
+    conn.commit()
+    conn.close()
+    return removed
+
+def get_cached_search(key, max_age_seconds):
+    """Returns (True, result) if a search result younger than max_age_seconds is stored, else (False, None)."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('SELECT result FROM search_cache WHERE key = ? AND fetched_at >= ?',
+              (key, time.time() - max_age_seconds))
+    row = c.fetchone()
+    conn.close()
+    if not row:
+        return False, None
+    return True, json.loads(row[0])
+
+def store_search_result(key, result):
+    """Saves a search result (any JSON-serializable value, including None) and releases its lease."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+        INSERT INTO search_cache (key, result, fetched_at, lease_until) VALUES (?, ?, ?, NULL)
+        ON CONFLICT(key) DO UPDATE SET result = excluded.result, fetched_at = excluded.fetched_at,
+                                       lease_until = NULL
+    ''', (key, json.dumps(result), time.time()))
+    conn.commit()
+    conn.close()
+
+def claim_search_lease(key, lease_seconds):
+    """
+    Marks a search as in flight across processes. Returns False if another
+    process holds an unexpired lease for the same key.
+    """
+    now = time.time()
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+        INSERT INTO search_cache (key, lease_until) VALUES (?, ?)
+        ON CONFLICT(key) DO UPDATE SET lease_until = excluded.lease_until
+        WHERE search_cache.lease_until IS NULL OR search_cache.lease_until < ?
+    ''', (key, now + lease_seconds, now))
+    claimed = c.rowcount == 1
+    conn.commit()
+    conn.close()
+    return claimed
+
+def release_search_lease(key):
+    """Drops an in-flight marker without storing a result (e.g. after an error)."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('UPDATE search_cache SET lease_until = NULL WHERE key = ?', (key,))
+    conn.commit()
+    conn.close()
+
 def get_setting(key):
     """Gets a setting value by key."""
     conn = get_connection()
@@ -118,6 +695,119 @@ def set_setting(key, value):
     conn.commit()
     conn.close()
 
+# ============================================================
+# SCHEDULER CHECKPOINTS
+# ============================================================
+
+def get_last_cycle():
+    """The most recent scheduler cycle row (finished or not), or None."""
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    c.execute('SELECT * FROM cycles ORDER BY id DESC LIMIT 1')
+    row = c.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def begin_cycle(interval_seconds, now=None):
+    """
+    Returns (cycle, resumed). An unfinished cycle younger than its interval is
+    resumed; an older one is closed as abandoned and a new cycle is started.
+    """
+    now = now or time.time()
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    with conn:
+        row = conn.execute('SELECT * FROM cycles WHERE finished_at IS NULL ORDER BY id DESC LIMIT 1').fetchone()
+        resumed = row is not None and row['started_at'] + row['interval_seconds'] > now
+        if not resumed:
+            # Anything still open is too old to be worth resuming; its routes are searched afresh
+            conn.execute('UPDATE cycles SET finished_at = ? WHERE finished_at IS NULL', (now,))
+            conn.execute('DELETE FROM cycle_observations')
+            cycle_id = conn.execute('INSERT INTO cycles (started_at, interval_seconds) VALUES (?, ?)',
+                                    (now, interval_seconds)).lastrowid
+            row = conn.execute('SELECT * FROM cycles WHERE id = ?', (cycle_id,)).fetchone()
+    conn.close()
+    return dict(row), resumed
+
+def mark_route_checked(destination_id, cycle_id, checked_at=None, observation=None):
+    """
+    Records that a route's observation for this cycle is stored. An observation
+    payload for the end-of-cycle rule evaluation is saved in the same
+    transaction, so a resumed cycle still alerts on routes it won't search again.
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('UPDATE destinations SET last_checked_at = ?, last_cycle_id = ? WHERE id = ?',
+              (checked_at or time.time(), cycle_id, destination_id))
+    if observation is not None:
+        c.execute('INSERT OR REPLACE INTO cycle_observations (cycle_id, destination_id, payload) VALUES (?, ?, ?)',
+                  (cycle_id, destination_id, json.dumps(observation)))
+    conn.commit()
+    conn.close()
+
+def get_cycle_observations(cycle_id):
+    """Observation payloads saved by mark_route_checked() for a cycle, in route order."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('SELECT payload FROM cycle_observations WHERE cycle_id = ? ORDER BY destination_id', (cycle_id,))
+    rows = c.fetchall()
+    conn.close()
+    return [json.loads(payload) for (payload,) in rows]
+
+def _queue_messages(conn, messages):
+    now = time.time()
+    conn.executemany('INSERT INTO outbox (chat_id, message, queued_at) VALUES (?, ?, ?)',
+                     [(chat_id, message, now) for chat_id, message in messages])
+
+def queue_messages(messages, cycle_id=None):
+    """
+    Adds (chat_id, message) pairs to the outbox. With a cycle_id, that cycle's
+    evaluated observations are dropped in the same transaction.
+    """
+    conn = get_connection()
+    with conn:
+        _queue_messages(conn, messages)
+        if cycle_id is not None:
+            conn.execute('DELETE FROM cycle_observations WHERE cycle_id = ?', (cycle_id,))
+    conn.close()
+
+def get_outbox():
+    """Undelivered messages as {chat_id: [(id, message), ...]}, oldest first."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('SELECT id, chat_id, message FROM outbox ORDER BY id')
+    rows = c.fetchall()
+    conn.close()
+    outbox = {}
+    for message_id, chat_id, message in rows:
+        outbox.setdefault(chat_id, []).append((message_id, message))
+    return outbox
+
+def delete_outbox_messages(message_ids):
+    conn = get_connection()
+    with conn:
+        conn.executemany('DELETE FROM outbox WHERE id = ?', [(i,) for i in message_ids])
+    conn.close()
+
+def mark_anywhere_done(cycle_id, messages=()):
+    """Checkpoints the cycle's anywhere searches together with the (chat_id, message) pairs they produced."""
+    conn = get_connection()
+    with conn:
+        _queue_messages(conn, messages)
+        conn.execute('UPDATE cycles SET anywhere_done = 1 WHERE id = ?', (cycle_id,))
+    conn.close()
+
+def finish_cycle(cycle_id, next_due, finished_at=None):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('UPDATE cycles SET finished_at = ?, next_due = ? WHERE id = ?',
+              (finished_at or time.time(), next_due, cycle_id))
+    # Only the recent past is interesting
+    c.execute('DELETE FROM cycles WHERE id <= ? - 1000', (cycle_id,))
+    conn.commit()
+    conn.close()
+
 # ============================================================
 # USER MANAGEMENT
 # ============================================================
@@ -131,6 +821,33 @@ def user_exists(username):
     conn.close()
     return exists
 
+def get_user(username):
+    """Returns {id, username, telegram_chat_id} for a username, or None."""
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    c.execute('SELECT id, username, telegram_chat_id FROM users WHERE username = ?', (username.lower(),))
+    row = c.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def set_user_chat_id(user_id, chat_id):
+    """Sets the Telegram chat that receives a user's notifications (None to clear)."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('UPDATE users SET telegram_chat_id = ? WHERE id = ?', (chat_id or None, user_id))
+    conn.commit()
+    conn.close()
+
+def get_user_chat_ids():
+    """Maps user id -> Telegram chat id for every user that has one configured."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('SELECT id, telegram_chat_id FROM users WHERE telegram_chat_id IS NOT NULL')
+    rows = c.fetchall()
+    conn.close()
+    return dict(rows)
+
 def create_user(username, password):
     """Create a new user with a hashed password. Returns (success, message)."""
     if user_exists(username):
@@ -172,6 +889,114 @@ def reset_password(username, new_password):
     conn.close()
     return True, "Password reset successfully!"
 
+# ============================================================
+# SESSIONS
+# ============================================================
+
+class _SessionCache:
+    """Small thread-safe LRU of token -> (username, cached_until)."""
+
+    def __init__(self, maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            username, cached_until = entry
+            if time.monotonic() >= cached_until:
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return username
+
+    def put(self, token, username):
+        with self._lock:
+            self._entries[token] = (username, time.monotonic() + self.ttl)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+_session_cache = _SessionCache()
+
+def create_session(username, ttl_seconds=SESSION_TTL_SECONDS):
+    """Starts a login session for a user. Returns the token, or None if the user doesn't exist."""
+    token = secrets.token_hex(16)
+    now = int(time.time())
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+        INSERT INTO sessions (token, user_id, created_at, last_seen, ttl_seconds, expires_at)
+        SELECT ?, id, ?, ?, ?, ? FROM users WHERE username = ?
+    ''', (token, now, now, ttl_seconds, now + ttl_seconds, username.lower()))
+    created = c.rowcount == 1
+    conn.commit()
+    conn.close()
+    if not created:
+        return None
+    _session_cache.put(token, username.lower())
+    return token
+
+def validate_session(token):
+    """
+    Returns the username for a live session token, or None.
+    Hits the in-process cache first; on a miss the session's expiry slides forward.
+    """
+    if not token:
+        return None
+    username = _session_cache.get(token)
+    if username is not None:
+        return username
+
+    now = int(time.time())
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT u.username FROM sessions s JOIN users u ON u.id = s.user_id
+        WHERE s.token = ? AND s.expires_at > ?
+    ''', (token, now))
+    row = c.fetchone()
+    if row:
+        c.execute('UPDATE sessions SET last_seen = ?, expires_at = ? + ttl_seconds WHERE token = ?',
+                  (now, now, token))
+        conn.commit()
+    conn.close()
+    if not row:
+        return None
+    _session_cache.put(token, row[0])
+    return row[0]
+
+def delete_session(token):
+    """Ends a session (logout)."""
+    _session_cache.discard(token)
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('DELETE FROM sessions WHERE token = ?', (token,))
+    conn.commit()
+    conn.close()
+
+def purge_expired_sessions():
+    """Deletes expired sessions. Returns the number removed."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('DELETE FROM sessions WHERE expires_at <= ?', (int(time.time()),))
+    removed = c.rowcount
+    conn.commit()
+    conn.close()
+    return removed
+
 if __name__ == "__main__":
     init_db()
     print("Database initialized successfully at:", os.path.abspath(DB_PATH))
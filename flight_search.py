@@ -1,20 +1,54 @@
 import os
-import requests
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
-from datetime import datetime
+
+import http_client
+from price_stats import TDigest
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 AMADEUS_API_KEY = os.environ.get("AMADEUS_API_KEY")
 AMADEUS_API_SECRET = os.environ.get("AMADEUS_API_SECRET")
 
+# Provider selection: "amadeus" or "fixture". The hedge provider is raced against
+# the primary when it is slower than its own p95. Hedging is off ("none") unless
+# configured; naming the primary itself opts in to duplicate (billable) searches.
+FLIGHT_PROVIDER = os.environ.get("FLIGHT_PROVIDER", "amadeus")
+FLIGHT_HEDGE_PROVIDER = os.environ.get("FLIGHT_HEDGE_PROVIDER", "none")
+# At most this many hedged searches per cycle, so one slow cycle can't double quota use
+HEDGE_MAX_PER_CYCLE = int(os.environ.get("HEDGE_MAX_PER_CYCLE", "10"))
+
+# Fixture replay: recorded Amadeus responses named ORIGIN_DEST_YYYY-MM-DD.json (or ORIGIN_DEST.json)
+FIXTURE_DIR = os.environ.get("FLIGHT_FIXTURE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures'))
+FIXTURE_LATENCY_MS = float(os.environ.get("FIXTURE_LATENCY_MS", "0"))
+# When set, live Amadeus responses are saved here in fixture format
+FLIGHT_RECORD_DIR = os.environ.get("FLIGHT_RECORD_DIR")
+
+# Destination placeholder in fixture names for "anywhere" (inspiration) searches: SFO_ANYWHERE.json
+ANYWHERE = "ANYWHERE"
+
+# Batched searches: one POST with a +/-3 day window (Amadeus' widest) covers 7 departure days of a route
+BATCH_WINDOW_DAYS = 3
+BATCH_MAX_OFFERS = 250
+
+HEDGE_QUANTILE = 0.95
+HEDGE_DEFAULT_DEADLINE = 3.0    # seconds, used until enough latency samples exist
+HEDGE_MIN_DEADLINE = 0.2
+HEDGE_MIN_SAMPLES = 20
+
 def get_amadeus_token():
     """
     Fetches the OAuth2 token required for Amadeus API calls.
     """
     if not AMADEUS_API_KEY or AMADEUS_API_KEY == "your_amadeus_api_key_here":
         return None
-        
+
     url = "https://test.api.amadeus.com/v1/security/oauth2/token"
     headers = {
         "Content-Type": "application/x-www-form-urlencoded"
@@ -24,103 +58,484 @@ def get_amadeus_token():
         "client_id": AMADEUS_API_KEY,
         "client_secret": AMADEUS_API_SECRET
     }
-    
+
     try:
-        response = requests.post(url, headers=headers, data=data, timeout=10)
+        response = http_client.post(url, headers=headers, data=data, timeout=10)
         response.raise_for_status()
         return response.json().get("access_token")
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching Amadeus token: {e}")
+    except http_client.RequestException as e:
+        logger.error("Error fetching Amadeus token: %s", e)
         return None
 
-def check_flights(origin_city_code, destination_city_code, from_time=None, to_time=None):
+def search_date(from_time):
+    """Amadeus requires an exact, future date: the route's earliest date (YYYY-MM-DD), today at the soonest, tomorrow if unset."""
+    import datetime as dt
+    if not from_time:
+        return (dt.date.today() + dt.timedelta(days=1)).isoformat()
+    return max(from_time, dt.date.today().isoformat())
+
+def parse_offer(data, origin_city_code, destination_city_code, departure_date):
     """
-    Queries the Amadeus Flight Offers Search API for the cheapest flight between two cities.
-    Returns the price, departure date, airline, and booking link, or None if no flight found.
+    Turns a flight-offers response into our flight dict (price, dates, booking link),
+    or None if it holds no usable offer.
     """
-    token = get_amadeus_token()
-    if not token:
-        print("Error: Missing or invalid Amadeus credentials in .env file")
+    if len(data.get('data', [])) == 0:
         return None
 
-    headers = {"Authorization": f"Bearer {token}"}
-    
-    # Amadeus requires exact dates. If none provided, let's search for tomorrow
-    import datetime as dt
-    if not from_time:
-        tomorrow = dt.datetime.now() + dt.timedelta(days=1)
-        from_time = tomorrow.strftime("%Y-%m-%d")
-    else:
-        # Convert DD/MM/YYYY from our DB to YYYY-MM-DD for Amadeus
+    flight_data = data["data"][0]
+
+    # Extract pricing
+    price = float(flight_data["price"]["total"])
+
+    # Extract airport codes
+    itineraries = flight_data.get("itineraries", [])
+    if not itineraries:
+        return None
+
+    segments = itineraries[0].get("segments", [])
+    if not segments:
+        return None
+
+    outbound_departure = segments[0]
+    outbound_arrival = segments[-1]
+
+    dep_iata = outbound_departure["departure"]["iataCode"]
+    arr_iata = outbound_arrival["arrival"]["iataCode"]
+    dep_date_raw = outbound_departure["departure"]["at"]
+    dep_date = dep_date_raw.split("T")[0]
+
+    # Note: Amadeus Free Tier doesn't do deep links natively like Kiwi,
+    # so we will construct a generic Google Flights deep link for the user
+    google_flights_link = f"https://www.google.com/flights?hl=en#flt={origin_city_code}.{destination_city_code}.{departure_date}"
+
+    return {
+        "price": price,
+        "departure_city_name": origin_city_code, # Amadeus uses codes primarily
+        "departure_airport_iata_code": dep_iata,
+        "arrival_city_name": destination_city_code,
+        "arrival_airport_iata_code": arr_iata,
+        "outbound_date": dep_date,
+        "inbound_date": None, # Kept None for 1-way simplicity on Amadeus
+        "deep_link": google_flights_link
+    }
+
+def cheapest_offer_by_date(data):
+    """Splits a multi-day flight-offers response into {departure date: cheapest raw offer of that day}."""
+    cheapest = {}
+    for offer in data.get("data", []):
         try:
-             parsed_date = dt.datetime.strptime(from_time, "%d/%m/%Y")
-             from_time = parsed_date.strftime("%Y-%m-%d")
-        except ValueError:
-             pass
+            day = offer["itineraries"][0]["segments"][0]["departure"]["at"].split("T")[0]
+            price = float(offer["price"]["total"])
+        except (KeyError, IndexError, TypeError, ValueError):
+            continue
+        if day not in cheapest or price < float(cheapest[day]["price"]["total"]):
+            cheapest[day] = offer
+    return cheapest
 
+def parse_destinations(data, limit=None):
+    """
+    Turns a flight-destinations (inspiration) response into a list of
+    {destination, price, departure_date, return_date} dicts, cheapest first.
+    """
+    results = []
+    for item in data.get("data", []):
+        try:
+            price = float(item["price"]["total"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        results.append({
+            "destination": item.get("destination"),
+            "price": price,
+            "departure_date": item.get("departureDate"),
+            "return_date": item.get("returnDate"),
+        })
+    results.sort(key=lambda r: r["price"])
+    return results[:limit] if limit else results
+
+def _fixture_name(origin, destination, departure_date=None):
+    suffix = f"_{departure_date}" if departure_date else ""
+    return f"{origin.upper()}_{destination.upper()}{suffix}.json"
+
+# ============================================================
+# PROVIDERS
+# ============================================================
+
+class FlightProvider:
+    """A source of flight offers. search() returns a flight dict or None."""
+
+    name = "base"
+    batch_days = 0  # departure days one search_dates() request can cover; 0 = no batching
+
+    def search(self, origin, destination, departure_date):
+        raise NotImplementedError
+
+    def search_dates(self, origin, destination, departure_dates):
+        """
+        Cheapest flight per departure day of one route in a single request, for a
+        window of batch_days days starting at the earliest of departure_dates.
+        Returns {date: flight dict} for the days it found offers for, or None on error.
+        """
+        raise NotImplementedError
+
+    def search_destinations(self, origin, departure_date=None, max_price=None):
+        """Cheapest destinations from an origin in one request: a list as from parse_destinations()."""
+        raise NotImplementedError
+
+class AmadeusProvider(FlightProvider):
+    """Amadeus Flight Offers Search (test environment)."""
+
+    name = "amadeus"
+    batch_days = 2 * BATCH_WINDOW_DAYS + 1
     url = "https://test.api.amadeus.com/v2/shopping/flight-offers"
-    query = {
-        "originLocationCode": origin_city_code,
-        "destinationLocationCode": destination_city_code,
-        "departureDate": from_time,
-        "adults": 1,
-        "max": 1, # Get only the cheapest option
-        "currencyCode": "USD"
-    }
-    
-    # Note: Amadeus Free Tier doesn't do deep links natively like Kiwi, 
-    # so we will construct a generic Google Flights deep link for the user
-    google_flights_link = f"https://www.google.com/flights?hl=en#flt={origin_city_code}.{destination_city_code}.{from_time}"
+    destinations_url = "https://test.api.amadeus.com/v1/shopping/flight-destinations"
 
-    try:
-        response = requests.get(
-            url=url,
-            headers=headers,
-            params=query,
-            timeout=10
-        )
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        if len(data.get('data', [])) == 0:
-             return None
-                 
-        flight_data = data["data"][0]
-        
-        # Extract pricing
-        price = float(flight_data["price"]["total"])
-        
-        # Extract airport codes
-        itineraries = flight_data.get("itineraries", [])
-        if not itineraries:
+    def search(self, origin, destination, departure_date):
+        token = get_amadeus_token()
+        if not token:
+            logger.error("Missing or invalid Amadeus credentials in .env file")
             return None
-            
-        segments = itineraries[0].get("segments", [])
-        if not segments:
+
+        headers = {"Authorization": f"Bearer {token}"}
+        query = {
+            "originLocationCode": origin,
+            "destinationLocationCode": destination,
+            "departureDate": departure_date,
+            "adults": 1,
+            "max": 1, # Get only the cheapest option
+            "currencyCode": "USD"
+        }
+
+        try:
+            response = http_client.get(
+                url=self.url,
+                headers=headers,
+                params=query,
+                timeout=10
+            )
+            response.raise_for_status()
+            data = response.json()
+        except http_client.RequestException as e:
+            logger.error("Error querying Amadeus API for %s-%s: %s", origin, destination, e)
             return None
-            
-        outbound_departure = segments[0]
-        outbound_arrival = segments[-1]
-        
-        dep_iata = outbound_departure["departure"]["iataCode"]
-        arr_iata = outbound_arrival["arrival"]["iataCode"]
-        dep_date_raw = outbound_departure["departure"]["at"]
-        dep_date = dep_date_raw.split("T")[0]
-        
-        return {
-            "price": price,
-            "departure_city_name": origin_city_code, # Amadeus uses codes primarily
-            "departure_airport_iata_code": dep_iata,
-            "arrival_city_name": destination_city_code,
-            "arrival_airport_iata_code": arr_iata,
-            "outbound_date": dep_date,
-            "inbound_date": None, # Kept None for 1-way simplicity on Amadeus
-            "deep_link": google_flights_link
+
+        if FLIGHT_RECORD_DIR:
+            os.makedirs(FLIGHT_RECORD_DIR, exist_ok=True)
+            with open(os.path.join(FLIGHT_RECORD_DIR, _fixture_name(origin, destination, departure_date)), "w") as f:
+                json.dump(data, f)
+
+        return parse_offer(data, origin, destination, departure_date)
+
+    def search_dates(self, origin, destination, departure_dates):
+        import datetime as dt
+        token = get_amadeus_token()
+        if not token:
+            logger.error("Missing or invalid Amadeus credentials in .env file")
+            return None
+
+        # The window is centred so it starts on the earliest requested day
+        first = dt.date.fromisoformat(min(departure_dates))
+        body = {
+            "currencyCode": "USD",
+            "originDestinations": [{
+                "id": "1",
+                "originLocationCode": origin,
+                "destinationLocationCode": destination,
+                "departureDateTimeRange": {
+                    "date": (first + dt.timedelta(days=BATCH_WINDOW_DAYS)).isoformat(),
+                    "dateWindow": f"I{BATCH_WINDOW_DAYS}D",
+                },
+            }],
+            "travelers": [{"id": "1", "travelerType": "ADULT"}],
+            "sources": ["GDS"],
+            "searchCriteria": {"maxFlightOffers": BATCH_MAX_OFFERS},
         }
-    except requests.exceptions.RequestException as e:
-        print(f"Error querying Amadeus API: {e}")
+
+        try:
+            response = http_client.post(
+                url=self.url,
+                headers={"Authorization": f"Bearer {token}", "X-HTTP-Method-Override": "GET"},
+                json=body,
+                timeout=20
+            )
+            response.raise_for_status()
+            data = response.json()
+        except http_client.RequestException as e:
+            logger.error("Error querying Amadeus API for %s-%s (batched): %s", origin, destination, e)
+            return None
+
+        found = {}
+        for day, offer in cheapest_offer_by_date(data).items():
+            found[day] = parse_offer({"data": [offer]}, origin, destination, day)
+            if FLIGHT_RECORD_DIR:
+                os.makedirs(FLIGHT_RECORD_DIR, exist_ok=True)
+                with open(os.path.join(FLIGHT_RECORD_DIR, _fixture_name(origin, destination, day)), "w") as f:
+                    json.dump({"data": [offer]}, f)
+        return found
+
+    def search_destinations(self, origin, departure_date=None, max_price=None):
+        token = get_amadeus_token()
+        if not token:
+            logger.error("Missing or invalid Amadeus credentials in .env file")
+            return None
+
+        query = {"origin": origin, "oneWay": "true", "nonStop": "false"}
+        if departure_date:
+            query["departureDate"] = departure_date
+        if max_price:
+            query["maxPrice"] = int(max_price)
+
+        try:
+            response = http_client.get(
+                url=self.destinations_url,
+                headers={"Authorization": f"Bearer {token}"},
+                params=query,
+                timeout=15
+            )
+            if response.status_code == 404:
+                return []  # no cached inspiration data for this origin/date
+            response.raise_for_status()
+            data = response.json()
+        except http_client.RequestException as e:
+            logger.error("Error querying Amadeus flight destinations from %s: %s", origin, e)
+            return None
+
+        if FLIGHT_RECORD_DIR:
+            os.makedirs(FLIGHT_RECORD_DIR, exist_ok=True)
+            with open(os.path.join(FLIGHT_RECORD_DIR, _fixture_name(origin, ANYWHERE, departure_date)), "w") as f:
+                json.dump(data, f)
+
+        return parse_destinations(data)
+
+class FixtureProvider(FlightProvider):
+    """Replays recorded Amadeus responses from FIXTURE_DIR (for local runs and load tests)."""
+
+    name = "fixture"
+    batch_days = 2 * BATCH_WINDOW_DAYS + 1
+
+    def __init__(self, fixture_dir=FIXTURE_DIR, latency_ms=FIXTURE_LATENCY_MS):
+        self.fixture_dir = fixture_dir
+        self.latency_ms = latency_ms
+
+    def _load(self, origin, destination, departure_date):
+        for name in (_fixture_name(origin, destination, departure_date), _fixture_name(origin, destination)):
+            path = os.path.join(self.fixture_dir, name)
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    return parse_offer(json.load(f), origin, destination, departure_date)
+        return None
+
+    def search(self, origin, destination, departure_date):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return self._load(origin, destination, departure_date)
+
+    def search_dates(self, origin, destination, departure_dates):
+        import datetime as dt
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)  # one round trip for the whole batch
+        first = dt.date.fromisoformat(min(departure_dates))
+        window = [(first + dt.timedelta(days=i)).isoformat() for i in range(self.batch_days)]
+        found = {day: self._load(origin, destination, day) for day in window}
+        return {day: flight for day, flight in found.items() if flight}
+
+    def search_destinations(self, origin, departure_date=None, max_price=None):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        for name in (_fixture_name(origin, ANYWHERE, departure_date), _fixture_name(origin, ANYWHERE)):
+            path = os.path.join(self.fixture_dir, name)
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    results = parse_destinations(json.load(f))
+                return [r for r in results if not max_price or r["price"] <= max_price]
+        return []
+
+PROVIDERS = {
+    "amadeus": AmadeusProvider,
+    "fixture": FixtureProvider,
+}
+
+_provider_instances = {}
+
+def get_provider(name):
+    """Returns the shared instance of a provider by name, or None for "none"/unknown."""
+    if not name or name == "none" or name not in PROVIDERS:
+        return None
+    if name not in _provider_instances:
+        _provider_instances[name] = PROVIDERS[name]()
+    return _provider_instances[name]
+
+# ============================================================
+# HEDGED REQUESTS
+# ============================================================
+
+class HedgeStats:
+    """Counters for hedged searches: how often we hedged and what it saved."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency = {}  # provider name -> TDigest of seconds
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.budget_used = 0
+            self.requests = 0
+            self.hedged = 0
+            self.hedge_wins = 0
+            self.saved_seconds = 0.0
+
+    def observe_latency(self, provider_name, seconds):
+        with self._lock:
+            self._latency.setdefault(provider_name, TDigest()).add(seconds)
+
+    def deadline(self, provider_name):
+        """Seconds to wait for a provider before hedging: its observed p95."""
+        with self._lock:
+            digest = self._latency.get(provider_name)
+            if digest is None or digest.count < HEDGE_MIN_SAMPLES:
+                return HEDGE_DEFAULT_DEADLINE
+            return max(digest.quantile(HEDGE_QUANTILE), HEDGE_MIN_DEADLINE)
+
+    def claim_hedge(self, limit):
+        """Takes one hedge from the per-cycle budget; False once limit hedges were sent since reset()."""
+        with self._lock:
+            if self.budget_used >= limit:
+                return False
+            self.budget_used += 1
+            return True
+
+    def record(self, hedged=False, hedge_won=False):
+        with self._lock:
+            self.requests += 1
+            self.hedged += hedged
+            self.hedge_wins += hedge_won
+
+    def record_saving(self, seconds):
+        with self._lock:
+            self.saved_seconds += max(seconds, 0.0)
+
+    def report(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedged": self.hedged,
+                "hedge_rate": self.hedged / self.requests if self.requests else 0.0,
+                "hedge_wins": self.hedge_wins,
+                "saved_seconds": round(self.saved_seconds, 3),
+            }
+
+hedge_stats = HedgeStats()
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="flight-search")
+        return _executor
+
+def _timed_search(provider, origin, destination, departure_date):
+    start = time.perf_counter()
+    try:
+        return provider.search(origin, destination, departure_date)
+    finally:
+        hedge_stats.observe_latency(provider.name, time.perf_counter() - start)
+
+def _hedged_search(primary, hedge, origin, destination, departure_date):
+    """
+    Runs the primary search; if it hasn't answered by its p95 deadline, races the
+    hedge provider (or a retry of the primary) and returns the first non-empty answer.
+    """
+    from profiling import profile_worker
+
+    pool = _get_executor()
+    first = pool.submit(profile_worker, _timed_search, primary, origin, destination, departure_date)
+    done, _ = wait([first], timeout=hedge_stats.deadline(primary.name))
+    if done or not hedge_stats.claim_hedge(HEDGE_MAX_PER_CYCLE):
+        hedge_stats.record()
+        return first.result()
+
+    second = pool.submit(profile_worker, _timed_search, hedge, origin, destination, departure_date)
+    pending = {first, second}
+    winner, result = None, None
+    while pending and winner is None:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                answer = future.result()
+            except Exception as e:
+                logger.warning("Flight search via %s failed: %s",
+                               primary.name if future is first else hedge.name, e)
+                continue
+            if answer is not None and winner is None:
+                winner, result = future, answer
+
+    hedge_won = winner is second
+    hedge_stats.record(hedged=True, hedge_won=hedge_won)
+    if hedge_won:
+        won_at = time.perf_counter()
+        # The primary keeps running; once it lands we know how long we would have waited
+        first.add_done_callback(lambda f: hedge_stats.record_saving(time.perf_counter() - won_at))
+    return result
+
+def hedge_report():
+    """One-line summary of hedging since the last reset (logged after each cycle)."""
+    r = hedge_stats.report()
+    return (f"searches={r['requests']} hedged={r['hedged']} ({r['hedge_rate']:.1%}) "
+            f"hedge_wins={r['hedge_wins']} saved={r['saved_seconds']:.1f}s")
+
+def check_flights(origin_city_code, destination_city_code, from_time=None, to_time=None):
+    """
+    Finds the cheapest flight between two cities through the configured provider(s).
+    Returns the price, departure date, airline, and booking link, or None if no flight found.
+    """
+    departure_date = search_date(from_time)
+    primary = get_provider(FLIGHT_PROVIDER)
+    if primary is None:
+        logger.error("Unknown flight provider '%s'", FLIGHT_PROVIDER)
+        return None
+
+    hedge = get_provider(FLIGHT_HEDGE_PROVIDER)
+    if hedge is None:
+        hedge_stats.record()
+        return _timed_search(primary, origin_city_code, destination_city_code, departure_date)
+    return _hedged_search(primary, hedge, origin_city_code, destination_city_code, departure_date)
+
+def check_flights_batch(origin_city_code, destination_city_code, departure_dates):
+    """
+    Cheapest flight per departure day of one route in a single request, over the
+    provider's batch_days window starting at the earliest of departure_dates
+    (YYYY-MM-DD). Returns {date: flight dict} for every day of the window with
+    offers; missing days, errors and providers without batching give fewer (or
+    no) entries, and those searches should be made one by one.
+    """
+    provider = get_provider(FLIGHT_PROVIDER)
+    if provider is None or not provider.batch_days:
+        return {}
+    hedge_stats.record()  # one request, however many days it covers
+    start = time.perf_counter()
+    try:
+        found = provider.search_dates(origin_city_code, destination_city_code, sorted(set(departure_dates)))
+    except Exception as e:
+        logger.warning("Batched search %s-%s failed: %s", origin_city_code, destination_city_code, e)
+        return {}
+    finally:
+        # Tracked apart from single searches: window answers are larger and slower, and
+        # mixing them in would inflate the p95 that single-search hedging waits for
+        hedge_stats.observe_latency(f"{provider.name}:batch", time.perf_counter() - start)
+    return found or {}
+
+def find_destinations(origin, departure_date=None, max_price=None):
+    """
+    Cheapest destinations from one origin in a single provider call ("anywhere" search).
+    departure_date is YYYY-MM-DD or None. Returns a list (cheapest first) or None on error.
+    """
+    provider = get_provider(FLIGHT_PROVIDER)
+    if provider is None:
+        logger.error("Unknown flight provider '%s'", FLIGHT_PROVIDER)
         return None
+    return provider.search_destinations(origin, departure_date, max_price)
 
 if __name__ == "__main__":
     # Test block
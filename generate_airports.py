@@ -1,57 +1,103 @@
 """
-Downloads the mwgg/Airports dataset and extracts commercial airports with IATA codes.
-Outputs a clean airports.json sorted by city name.
+Builds airports.json and airports.bin from the mwgg/Airports dataset.
+
+Extracts commercial airports with IATA codes, sorts them by city name and
+writes deterministic output: the same input always produces byte-identical
+files. airports.bin is the compact index read by airports.py.
+
+Usage:
+    python generate_airports.py                          # download from GitHub
+    python generate_airports.py --input raw.json         # offline build
+    python generate_airports.py --input airports.json    # rebuild airports.bin only
 """
+import argparse
 import json
+import os
 import urllib.request
 
+from airports import build_binary, canonical_json, dataset_digest
+
 URL = "https://raw.githubusercontent.com/mwgg/Airports/master/airports.json"
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_raw(input_path=None):
+    """Reads the source dataset from a local file, or downloads it."""
+    if input_path:
+        print(f"Reading airport data from {input_path}...")
+        with open(input_path, 'r') as f:
+            return json.load(f)
+    print("Downloading airport data...")
+    with urllib.request.urlopen(URL) as resp:
+        return json.loads(resp.read().decode())
+
+
+def extract_airports(raw):
+    """
+    Filters the raw dataset down to airports with a valid IATA code.
+    Accepts the mwgg dict (keyed by ICAO) or an already-filtered airports.json list.
+    """
+    if isinstance(raw, dict):
+        # Iterate in ICAO order so duplicate IATA codes resolve the same way every run
+        entries = [raw[icao] for icao in sorted(raw)]
+    else:
+        entries = [{"iata": a["code"], **a} for a in raw]
+
+    airports = []
+    seen_codes = set()
+    for info in entries:
+        iata = info.get("iata", "").strip()
+        city = info.get("city", "").strip()
+        name = info.get("name", "").strip()
+        country = info.get("country", "").strip()
+
+        # Must have valid IATA code (3 letters), city, and name
+        if len(iata) != 3 or not city or not name:
+            continue
+        # Skip duplicates
+        if iata in seen_codes:
+            continue
+        # Skip codes that look invalid (numbers, weird chars)
+        if not iata.isalpha():
+            continue
+
+        seen_codes.add(iata)
+        airports.append({
+            "code": iata,
+            "name": name,
+            "city": city,
+            "country": country
+        })
+    return airports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build airports.json and airports.bin")
+    parser.add_argument("--input", help="Local mwgg/Airports JSON file (skips the download)")
+    parser.add_argument("--output-dir", default=BASE_DIR, help="Where to write the outputs")
+    args = parser.parse_args()
+
+    raw = load_raw(args.input)
+    print(f"Total airports in dataset: {len(raw)}")
+
+    airports = extract_airports(raw)
+    print(f"Filtered to {len(airports)} airports with valid IATA codes")
+
+    json_text = canonical_json(airports)
+    digest = dataset_digest(json_text)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    json_path = os.path.join(args.output_dir, "airports.json")
+    bin_path = os.path.join(args.output_dir, "airports.bin")
+    with open(json_path, "w") as f:
+        f.write(json_text)
+    with open(bin_path, "wb") as f:
+        f.write(build_binary(airports, digest))
+
+    print(f"Dataset version: {digest.hex()}")
+    print(f"Written to {json_path} ({os.path.getsize(json_path):,} bytes)")
+    print(f"Written to {bin_path} ({os.path.getsize(bin_path):,} bytes)")
+
 
-print("Downloading airport data...")
-with urllib.request.urlopen(URL) as resp:
-    raw = json.loads(resp.read().decode())
-
-print(f"Total airports in dataset: {len(raw)}")
-
-# Filter: must have a valid 3-letter IATA code and a city name
-airports = []
-seen_codes = set()
-for icao, info in raw.items():
-    iata = info.get("iata", "").strip()
-    city = info.get("city", "").strip()
-    name = info.get("name", "").strip()
-    country = info.get("country", "").strip()
-    
-    # Must have valid IATA code (3 letters), city, and name
-    if len(iata) != 3 or not city or not name:
-        continue
-    # Skip duplicates
-    if iata in seen_codes:
-        continue
-    # Skip codes that look invalid (numbers, weird chars)
-    if not iata.isalpha():
-        continue
-    
-    seen_codes.add(iata)
-    airports.append({
-        "code": iata,
-        "name": name,
-        "city": city,
-        "country": country
-    })
-
-# Sort by city name
-airports.sort(key=lambda a: a["city"].lower())
-
-print(f"Filtered to {len(airports)} airports with valid IATA codes")
-
-# Write output
-output_path = "/home/vslevaraj/.gemini/antigravity/scratch/flight-tracker/airports.json"
-with open(output_path, "w") as f:
-    json.dump(airports, f, indent=2, ensure_ascii=False)
-
-print(f"Written to {output_path}")
-
-# Verify Reykjavik is included
-kef = [a for a in airports if "eykjav" in a["city"].lower() or a["code"] == "KEF"]
-print(f"Reykjavik airports found: {kef}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Shared HTTP client: one pooled keep-alive session per host.
+
+Amadeus searches, Telegram sends and OTP messages all go through here, so
+repeat calls to a host reuse an open TCP+TLS connection instead of paying
+a new handshake each time. Every request gets a (connect, read) timeout.
+Failed connects are retried for any method, since nothing reached the
+server yet. 429/5xx answers are only retried for idempotent methods
+(GET/HEAD/...), so a Telegram POST is never sent twice, and Retry-After is
+honoured up to HTTP_MAX_RETRY_AFTER seconds. Read timeouts are never
+retried: the server may already be working on (and billing) the request,
+and flight searches have their own hedging for slow answers.
+
+Connection reuse per host (requests vs. new connections) is available from
+pool_stats() and logged by the scheduler after every cycle.
+"""
+import logging
+import os
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "10"))       # connections kept open per host
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "10"))     # default when a call passes none
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "2"))
+HTTP_RETRY_BACKOFF = 0.5
+HTTP_MAX_RETRY_AFTER = 5.0   # longest Retry-After sleep before a retry
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+RequestException = requests.exceptions.RequestException
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+class _CappedRetry(Retry):
+    """Retry that won't sleep longer than HTTP_MAX_RETRY_AFTER for a Retry-After header."""
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, HTTP_MAX_RETRY_AFTER)
+
+
+def _new_session():
+    retry = _CappedRetry(
+        total=HTTP_RETRIES,
+        read=0,  # a timed-out request may still be running (and billed) server-side
+        backoff_factor=HTTP_RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,  # idempotent methods only
+        respect_retry_after_header=True,
+        raise_on_status=False,  # hand the last 429/5xx back; callers raise_for_status()
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def session_for(url):
+    """The shared session for a URL's host, created on first use."""
+    parts = urlsplit(url)
+    host = f"{parts.scheme}://{parts.netloc}"
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = _sessions[host] = _new_session()
+        return session
+
+
+def request(method, url, timeout=None, **kwargs):
+    """Like requests.request() over the host's pooled session; timeout is the read timeout in seconds."""
+    return session_for(url).request(method, url, timeout=(HTTP_CONNECT_TIMEOUT, timeout or HTTP_READ_TIMEOUT),
+                                    **kwargs)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def pool_stats():
+    """{host: {"requests", "connections", "reuse_rate"}} since the sessions were created."""
+    with _lock:
+        sessions = dict(_sessions)
+    stats = {}
+    for host, session in sessions.items():
+        container = session.get_adapter(host).poolmanager.pools
+        pools = [pool for pool in map(container.get, container.keys()) if pool is not None]
+        sent = sum(pool.num_requests for pool in pools)
+        opened = sum(pool.num_connections for pool in pools)
+        stats[urlsplit(host).netloc] = {
+            "requests": sent,
+            "connections": opened,
+            "reuse_rate": 1 - opened / sent if sent else 0.0,
+        }
+    return stats
+
+
+def stats_report():
+    """One-line summary of connection reuse per host."""
+    stats = pool_stats()
+    if not stats:
+        return "no requests yet"
+    return ", ".join(f"{host}: {s['requests']} requests over {s['connections']} connection(s) "
+                     f"({s['reuse_rate']:.0%} reused)" for host, s in sorted(stats.items()))
+
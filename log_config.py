@@ -0,0 +1,120 @@
+"""
+Non-blocking logging for the scheduler process.
+
+Callers only enqueue records: a QueueHandler on the root logger hands the
+unformatted record to a bounded in-memory queue, and a background
+QueueListener does the formatting and all I/O. The hot path never waits on the
+disk; if the queue is ever full, records are dropped and counted instead
+(take_dropped(), reported by the scheduler after every cycle).
+
+File output is JSON lines with size- or time-based rotation, console output
+stays human-readable. Extra context passed via `extra=` (or a LoggerAdapter),
+e.g. route and route_id, ends up as top-level JSON fields.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+LOG_FILE = os.environ.get("LOG_FILE", "flight_tracker.log")
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", "5"))
+# e.g. "midnight" or "H" to rotate by time instead of size
+LOG_ROTATE_WHEN = os.environ.get("LOG_ROTATE_WHEN")
+LOG_QUEUE_SIZE = 10000
+
+# Attributes every LogRecord has; anything else came from `extra=` and is emitted as context
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, plus any extra context."""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueues records without formatting them; msg % args is evaluated by the
+    listener thread. Never blocks: drops (and counts) records when the queue is full.
+    """
+
+    dropped = 0
+    _dropped_lock = threading.Lock()
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with DeferredQueueHandler._dropped_lock:
+                DeferredQueueHandler.dropped += 1
+
+
+def take_dropped():
+    """Records dropped on a full queue since the last call (and resets the count)."""
+    with DeferredQueueHandler._dropped_lock:
+        dropped, DeferredQueueHandler.dropped = DeferredQueueHandler.dropped, 0
+    return dropped
+
+
+def _file_handler(path):
+    if LOG_ROTATE_WHEN:
+        return logging.handlers.TimedRotatingFileHandler(path, when=LOG_ROTATE_WHEN,
+                                                         backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    return logging.handlers.RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES,
+                                                backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+
+
+def setup_logging(log_file=LOG_FILE, level=LOG_LEVEL):
+    """Routes all logging through a background listener (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    file_handler = _file_handler(log_file)
+    file_handler.setFormatter(JsonFormatter())
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler,
+                                               respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Flushes queued records and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
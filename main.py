@@ -1,108 +1,265 @@
 import time
 import logging
-from database import init_db, get_all_destinations, update_lowest_price, get_setting
-from flight_search import check_flights
-from notifier import send_telegram_message
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.FileHandler("flight_tracker.log"),
-        logging.StreamHandler()
-    ]
-)
+from collections import defaultdict
+from database import (init_db, get_active_destinations, archive_expired_routes, get_setting,
+                      purge_expired_sessions, get_user_chat_ids, get_alert_rules,
+                      prune_fare_calendar, get_anywhere_watches, get_last_cycle,
+                      begin_cycle, mark_route_checked, mark_anywhere_done, finish_cycle,
+                      get_cycle_observations, queue_messages, get_outbox, delete_outbox_messages)
+
+logger = logging.getLogger(__name__)
+
+SESSION_PURGE_INTERVAL_SECONDS = 3600
+
+def format_message(dest, flight, lowest_seen, insight, triggered):
+    """Renders one route's Telegram message; triggered is a list of (rule, threshold) from alerts.evaluate."""
+    from alerts import describe
+
+    price = flight['price']
+    if triggered:
+        # A rule fired — highlight it!
+        msg = f"📉 <b>FLIGHT PRICE DROP ALERT!</b> 📉\n\n"
+    else:
+        msg = f"✈️ <b>Hourly Price Update</b>\n\n"
+    msg += f"<b>{flight['departure_city_name']} ({flight['departure_airport_iata_code']}) ➡️ {flight['arrival_city_name']} ({flight['arrival_airport_iata_code']})</b>\n\n"
+    msg += f"{'🔥' if triggered else '💰'} <b>Current Price: ${price}</b>\n"
+    msg += f"🎯 Your Target: ${dest['target_price']}\n"
+    msg += f"📊 Lowest Seen: {f'${lowest_seen}' if lowest_seen else 'N/A'}\n"
+    for rule, threshold in triggered:
+        msg += f"🔔 {describe(rule, threshold)}\n"
+    msg += f"{insight}\n"
+    msg += f"🛫 Outbound: {flight['outbound_date']}\n"
+    if flight['inbound_date']:
+        msg += f"🛬 Inbound:  {flight['inbound_date']}\n\n"
+    else:
+        msg += "\n"
+    msg += f"<a href='{flight['deep_link']}'>✈️ Book on Google Flights</a>"
+    return msg
+
+def check_anywhere_watches(watches, outbox, chat_ids):
+    """One inspiration search per (origin, date) serves every "anywhere" watch on it."""
+    from refresh import fetch_destinations, destinations_under_budget
+
+    searches = defaultdict(list)
+    for watch in watches:
+        searches[(watch['origin'], watch['departure_date'])].append(watch)
+
+    for (origin, departure_date), group in searches.items():
+        log = logging.LoggerAdapter(logger, {"route": f"{origin}-*"})
+        log.info("Searching anywhere from %s (%d watch(es))", origin, len(group))
+        results = fetch_destinations(origin, departure_date)
+        if results is None:
+            log.info("  Anywhere search from %s failed.", origin)
+            continue
+        for watch in group:
+            matches = destinations_under_budget(results, watch['max_price'])
+            if not matches:
+                continue
+            msg = f"🌍 <b>Anywhere from {origin} under ${watch['max_price']:,.0f}</b>\n\n"
+            for m in matches:
+                msg += f"✈️ {m['name']}: <b>${m['price']:,.0f}</b> on {m['departure_date']}\n"
+            outbox[chat_ids.get(watch['user_id'])].append(msg)
 
 def job():
-    logging.info("Running flight price check...")
+    # Imported on first run: pulls in requests/dotenv/numpy, which the scheduler
+    # doesn't need until there is work to do.
+    from refresh import fetch_offer, prefetch_offers, record_observation, search_key
+    from notifier import send_batched_messages
+    from alerts import ObservationBatch, evaluate
+
+    logger.info("Running flight price check...")
     
-    destinations = get_all_destinations()
+    # Progress is checkpointed per route, so a crash or redeploy resumes this cycle
+    interval = check_interval_seconds()
+    cycle, resumed = begin_cycle(interval)
     
-    if not destinations:
-        logging.info("No destinations configured yet.")
+    # Routes whose travel window has ended are archived, not searched
+    archived = archive_expired_routes()
+    if archived:
+        logger.info("Archived %d route(s) whose travel window has ended.", len(archived))
+    destinations = get_active_destinations()
+    watches = get_anywhere_watches()
+    
+    if not destinations and not watches and not archived:
+        logger.info("No destinations configured yet.")
+        finish_cycle(cycle['id'], cycle['started_at'] + interval)
         return
+    
+    pending = [d for d in destinations if d['last_cycle_id'] != cycle['id']]
+    if resumed:
+        logger.info("Resuming interrupted cycle %d: %d of %d route(s) left%s", cycle['id'], len(pending),
+                    len(destinations), "" if cycle['anywhere_done'] else ", anywhere searches pending")
+    
+    # Notifications wait in the database outbox and are delivered per recipient at the end
+    # of the cycle, so a crash before sending doesn't lose them. Users without their own
+    # chat id fall back to the default TELEGRAM_CHAT_ID (key None).
+    chat_ids = get_user_chat_ids()
+    rules = get_alert_rules()
+    queue_messages([
+        (chat_ids.get(dest['user_id']),
+         f"🗄️ <b>Route archived</b>\n\n"
+         f"📍 {dest['departure_city_code']} ➡️ {dest['destination_city_code']}\n"
+         f"📅 Travel window ended {dest['date_to']}, so it is no longer checked.")
+        for dest in archived
+    ])
+    
+    # Window searches up front: routes that can share a provider request do, and each
+    # answer also fills the route's fare calendar for the week
+    prefetched = prefetch_offers(pending, pause_seconds=2)
+    
+    # Pass 1: search and record every route. Each observation for the rule engine is
+    # saved with the route's checkpoint, so routes done before a crash still alert.
+    for dest in pending:
+        route = f"{dest['departure_city_code']}-{dest['destination_city_code']}"
+        log = logging.LoggerAdapter(logger, {"route": route, "route_id": dest['id']})
+        log.info("Checking flights: %s", route)
         
-    for dest in destinations:
-        logging.info(f"Checking flights: {dest['departure_city_code']} -> {dest['destination_city_code']}")
-        
-        # Adding a small delay to avoid hitting rate limits
-        time.sleep(2)
+        # Adding a small delay to avoid hitting rate limits (not needed when the batch answered)
+        key = search_key(dest['departure_city_code'], dest['destination_city_code'], dest['date_from'], dest['date_to'])
+        if key not in prefetched:
+            time.sleep(2)
         
-        flight = check_flights(
-            origin_city_code=dest['departure_city_code'],
-            destination_city_code=dest['destination_city_code'],
-            from_time=dest['date_from'],
-            to_time=dest['date_to']
+        # Shares results with "check now" and with other users tracking the same search
+        flight = fetch_offer(
+            dest['departure_city_code'],
+            dest['destination_city_code'],
+            dest['date_from'],
+            dest['date_to']
         )
         
         if flight is None:
-            logging.info(f"  No flights found for {dest['destination_city_code']}.")
+            log.info("  No flights found for %s.", dest['destination_city_code'])
+            mark_route_checked(dest['id'], cycle['id'])
             continue
-            
+        
         current_price = flight['price']
-        target_price = dest['target_price']
         lowest_seen = dest['lowest_price_seen']
         
-        logging.info(f"  Current Price: ${current_price} | Target: ${target_price} | Lowest Seen: {f'${lowest_seen}' if lowest_seen else 'N/A'}")
+        # Always record the price and update the lowest seen for dashboard visibility
+        recorded = record_observation(dest, current_price, flight['outbound_date'], flight.get('quoted_at'))
+        if recorded is None:
+            # A "check now" already recorded this cached quote
+            log.info("  Quote already recorded by a recent check; skipping.")
+            mark_route_checked(dest['id'], cycle['id'])
+            continue
+        is_new_low, stats = recorded
         
-        # Always update the lowest price seen for dashboard visibility
-        if lowest_seen is None or current_price < lowest_seen:
-            update_lowest_price(dest['id'], current_price)
-            logging.info(f"  Updated lowest price seen to ${current_price}")
+        log.info("  Current Price: $%s | Target: $%s | Lowest Seen: %s",
+                 current_price, dest['target_price'], lowest_seen or "N/A")
+        if is_new_low:
+            log.info("  Updated lowest price seen to $%s", current_price)
         
-        # Build and send notification every check
-        if current_price <= target_price:
-            # Price is at or below target — highlight it!
-            msg = f"📉 <b>FLIGHT PRICE DROP ALERT!</b> 📉\n\n"
-            msg += f"<b>{flight['departure_city_name']} ({flight['departure_airport_iata_code']}) ➡️ {flight['arrival_city_name']} ({flight['arrival_airport_iata_code']})</b>\n\n"
-            msg += f"🔥 <b>Current Price: ${current_price}</b>\n"
-            msg += f"🎯 Your Target: ${target_price}\n"
-            msg += f"📊 Lowest Seen: {f'${lowest_seen}' if lowest_seen else 'N/A'}\n\n"
-            msg += f"🛫 Outbound: {flight['outbound_date']}\n"
-            if flight['inbound_date']:
-                msg += f"🛬 Inbound:  {flight['inbound_date']}\n\n"
-            else:
-                msg += "\n"
-            msg += f"<a href='{flight['deep_link']}'>✈️ Book on Google Flights</a>"
-        else:
-            # Price is above target — send a regular update
-            msg = f"✈️ <b>Hourly Price Update</b>\n\n"
-            msg += f"<b>{flight['departure_city_name']} ({flight['departure_airport_iata_code']}) ➡️ {flight['arrival_city_name']} ({flight['arrival_airport_iata_code']})</b>\n\n"
-            msg += f"💰 <b>Current Price: ${current_price}</b>\n"
-            msg += f"🎯 Your Target: ${target_price}\n"
-            msg += f"📊 Lowest Seen: {f'${lowest_seen}' if lowest_seen else 'N/A'}\n\n"
-            msg += f"🛫 Outbound: {flight['outbound_date']}\n"
-            if flight['inbound_date']:
-                msg += f"🛬 Inbound:  {flight['inbound_date']}\n\n"
-            else:
-                msg += "\n"
-            msg += f"<a href='{flight['deep_link']}'>✈️ Book on Google Flights</a>"
+        # Context from the route's streaming statistics (no price_history scan)
+        insight = ""
+        if stats.is_in_bottom(current_price, 0.10):
+            insight = f"🏷️ In the cheapest 10% seen for this route (avg ${stats.ewma:,.0f})\n"
         
-        logging.info(f"  Sending hourly price notification: ${current_price}")
-        send_telegram_message(msg)
+        mark_route_checked(dest['id'], cycle['id'], observation={
+            "dest": dest, "flight": flight, "lowest": lowest_seen, "insight": insight,
+            "average": stats.prev_ewma, "previous": stats.prev_price,
+        })
+    
+    # Pass 2: every rule for every route checked this cycle in one vectorized evaluation
+    observations = get_cycle_observations(cycle['id'])
+    batch = ObservationBatch()
+    for obs in observations:
+        dest = obs['dest']
+        batch.add(dest['id'], obs['flight']['price'], dest['target_price'], lowest=obs['lowest'],
+                  average=obs['average'], previous=obs['previous'], rules=rules.get(dest['id']))
+    triggered = evaluate(batch)
+    logger.info("Alert rules fired for %d of %d route(s).", len(triggered), len(batch))
+    
+    queue_messages([
+        (chat_ids.get(obs['dest']['user_id']),
+         format_message(obs['dest'], obs['flight'], obs['lowest'], obs['insight'],
+                        triggered.get(obs['dest']['id'], [])))
+        for obs in observations
+    ], cycle_id=cycle['id'])
+    
+    if not cycle['anywhere_done']:
+        found = defaultdict(list)
+        check_anywhere_watches(watches, found, chat_ids)
+        mark_anywhere_done(cycle['id'], [(chat_id, msg) for chat_id, msgs in found.items() for msg in msgs])
+    
+    # Messages leave the outbox once handed to the notifier (including any left by a crash)
+    for chat_id, queued in get_outbox().items():
+        logger.info("Sending %d price update(s) to %s", len(queued), chat_id or "default chat")
+        send_batched_messages([msg for _, msg in queued], chat_id=chat_id)
+        delete_outbox_messages([message_id for message_id, _ in queued])
+    
+    finish_cycle(cycle['id'], cycle['started_at'] + interval)
+    
+    from flight_search import hedge_report, hedge_stats
+    logger.info("Search hedging this cycle: %s", hedge_report())
+    hedge_stats.reset()
+
+    from log_config import take_dropped
+    dropped = take_dropped()
+    if dropped:
+        logger.warning("Dropped %d log record(s) this cycle: the log queue was full.", dropped)
+
+    from http_client import stats_report
+    logger.info("HTTP connection reuse since start: %s", stats_report())
+
+def check_interval_seconds():
+    # Read from the database every time so dashboard changes take effect live
+    return int(get_setting('check_frequency_minutes') or 60) * 60
+
+def next_due_time():
+    """When the next cycle should start: immediately after an interrupted cycle or on a fresh install."""
+    cycle = get_last_cycle()
+    if cycle is None or cycle['finished_at'] is None:
+        return 0
+    return cycle['started_at'] + check_interval_seconds()
 
 def start_scheduler():
-    # Run once immediately on startup
+    from log_config import setup_logging
+    from profiling import run_maybe_profiled
+    setup_logging()
+
     init_db()
-    job()
     
-    logging.info("Scheduler activated. Frequency is read dynamically from the database.")
+    # JSON API for scripts and shortcuts (API_PORT=0 disables it)
+    from api import API_PORT, start_api_server
+    if API_PORT:
+        start_api_server()
+    
+    # Periodic online snapshots of the database (BACKUP_INTERVAL_HOURS=0 disables them)
+    from backup import BACKUP_INTERVAL_HOURS, start_backup_scheduler
+    if BACKUP_INTERVAL_HOURS:
+        start_backup_scheduler()
+    
+    # No unconditional run on startup: a restart within the interval waits for the
+    # next due time, and an interrupted cycle is resumed right away
+    due = next_due_time()
+    if due > time.time():
+        logger.info("Last cycle is still current; next check due at %s.", time.strftime("%H:%M:%S", time.localtime(due)))
+    
+    logger.info("Scheduler activated. Frequency is read dynamically from the database.")
     try:
-        last_run = time.time()
+        last_purge = 0
         while True:
-            # Read frequency from database on every loop so dashboard changes take effect live
-            freq_minutes = int(get_setting('check_frequency_minutes') or 60)
-            elapsed = time.time() - last_run
-            
-            if elapsed >= freq_minutes * 60:
-                logging.info(f"Running scheduled check (frequency: every {freq_minutes} minutes)...")
-                job()
-                last_run = time.time()
+            # Housekeeping: drop expired dashboard logins and departed fare calendar days
+            if time.time() - last_purge >= SESSION_PURGE_INTERVAL_SECONDS:
+                removed = purge_expired_sessions()
+                if removed:
+                    logger.info("Purged %d expired sessions.", removed)
+                pruned = prune_fare_calendar()
+                if pruned:
+                    logger.info("Pruned %d past fare calendar day(s).", pruned)
+                last_purge = time.time()
+
+            if time.time() >= next_due_time():
+                logger.info("Running scheduled check (frequency: every %d minutes)...", check_interval_seconds() // 60)
+                try:
+                    run_maybe_profiled(job)
+                except Exception:
+                    # The cycle stays unfinished, so it is resumed on the next pass
+                    logger.exception("Scheduled check failed.")
             
             time.sleep(30)  # Check every 30 seconds if it's time to run
     except KeyboardInterrupt:
-        logging.info("Scheduler stopped.")
+        logger.info("Scheduler stopped.")
 
 if __name__ == "__main__":
     start_scheduler()
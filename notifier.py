@@ -1,53 +1,162 @@
 import os
-import requests
+import logging
+import threading
+import time
 from dotenv import load_dotenv
 
+import http_client
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
+# Default recipient for users who haven't set their own chat id
 TELEGRAM_CHAT_ID = os.environ.get("TELEGRAM_CHAT_ID")
 
-def send_telegram_message(message_text):
+# Telegram rejects messages longer than this
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+BATCH_SEPARATOR = "\n\n────────────\n\n"
+
+# Telegram allows a bot about 30 messages per second overall and about one per
+# second in a single chat; sends are paced under both
+TELEGRAM_MESSAGES_PER_SECOND = float(os.environ.get("TELEGRAM_MESSAGES_PER_SECOND", "25"))
+TELEGRAM_CHAT_INTERVAL = 1.0
+TELEGRAM_SEND_ATTEMPTS = 4      # tries per message when Telegram answers 429/5xx
+TELEGRAM_MAX_RETRY_AFTER = 60   # longest flood-control wait honoured before giving up
+
+class _SendPacer:
+    """Spaces sends under the bot-wide and per-chat limits; shared by all threads."""
+
+    def __init__(self, rate, chat_interval):
+        self.interval = 1.0 / rate
+        self.chat_interval = chat_interval
+        self._next_any = 0.0
+        self._next_chat = {}
+        self._lock = threading.Lock()
+
+    def wait(self, chat_id):
+        with self._lock:
+            now = time.monotonic()
+            at = max(now, self._next_any, self._next_chat.get(chat_id, 0.0))
+            self._next_any = at + self.interval
+            if len(self._next_chat) > 1000:
+                self._next_chat = {c: t for c, t in self._next_chat.items() if t > now}
+            self._next_chat[chat_id] = at + self.chat_interval
+        if at > now:
+            time.sleep(at - now)
+
+    def defer(self, seconds, chat_id=None):
+        """Holds back one chat (or every send, for chat_id None) for `seconds`."""
+        with self._lock:
+            until = time.monotonic() + seconds
+            if chat_id is None:
+                self._next_any = max(self._next_any, until)
+            else:
+                self._next_chat[chat_id] = max(self._next_chat.get(chat_id, 0.0), until)
+
+_pacer = _SendPacer(TELEGRAM_MESSAGES_PER_SECOND, TELEGRAM_CHAT_INTERVAL)
+
+def _retry_after(response):
+    """Seconds Telegram's flood control asks us to wait (parameters.retry_after)."""
+    try:
+        seconds = (response.json().get("parameters") or {}).get("retry_after")
+    except (ValueError, AttributeError):
+        seconds = None
+    if seconds is None:
+        seconds = response.headers.get("Retry-After")
+    try:
+        return float(seconds)
+    except (TypeError, ValueError):
+        return 1.0
+
+def _post_paced(url, payload):
+    """POSTs one message under the rate limits, retrying 429 and 5xx answers. Returns the last response."""
+    chat_id = payload["chat_id"]
+    for attempt in range(1, TELEGRAM_SEND_ATTEMPTS + 1):
+        _pacer.wait(chat_id)
+        response = http_client.post(url, json=payload, timeout=10)
+        if response.status_code != 429 and response.status_code < 500:
+            return response
+        # 429 is flood control for the whole bot; a 5xx only backs off this chat
+        flooded = response.status_code == 429
+        delay = _retry_after(response) if flooded else 2.0 ** attempt
+        if attempt == TELEGRAM_SEND_ATTEMPTS or delay > TELEGRAM_MAX_RETRY_AFTER:
+            break
+        logger.warning("Telegram answered %d; retrying in %.0fs (attempt %d of %d).",
+                       response.status_code, delay, attempt, TELEGRAM_SEND_ATTEMPTS)
+        _pacer.defer(delay, None if flooded else chat_id)
+    return response
+
+def send_telegram_message(message_text, chat_id=None):
     """
-    Sends a message via the Telegram Bot API to a specific chat ID.
+    Sends a message via the Telegram Bot API to a specific chat ID
+    (defaults to TELEGRAM_CHAT_ID from the environment).
     """
-    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID or TELEGRAM_BOT_TOKEN == "your_telegram_bot_token_here":
-        print("Error: Missing Telegram credentials in .env file")
-        print(f"Would have sent: {message_text}")
+    chat_id = chat_id or TELEGRAM_CHAT_ID
+    if not TELEGRAM_BOT_TOKEN or not chat_id or TELEGRAM_BOT_TOKEN == "your_telegram_bot_token_here":
+        logger.error("Missing Telegram credentials in .env file")
+        logger.info("Would have sent: %s", message_text)
         return False
 
     url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
     
     payload = {
-        "chat_id": TELEGRAM_CHAT_ID,
+        "chat_id": chat_id,
         "text": message_text,
         "parse_mode": "HTML",
         "disable_web_page_preview": False
     }
 
     try:
-        response = requests.post(url, json=payload, timeout=10)
+        response = _post_paced(url, payload)
         if response.status_code == 400:
             # HTML parse error — retry without parse_mode
-            print(f"Telegram HTML parse error: {response.text}")
-            print("Retrying without HTML formatting...")
+            logger.warning("Telegram HTML parse error: %s", response.text)
+            logger.warning("Retrying without HTML formatting...")
             import re
             plain_text = re.sub(r'<[^>]+>', '', message_text)
             payload_plain = {
-                "chat_id": TELEGRAM_CHAT_ID,
+                "chat_id": chat_id,
                 "text": plain_text,
                 "disable_web_page_preview": False
             }
-            response = requests.post(url, json=payload_plain, timeout=10)
+            response = _post_paced(url, payload_plain)
         response.raise_for_status()
-        print("Telegram notification sent successfully.")
+        logger.info("Telegram notification sent successfully.")
         return True
-    except requests.exceptions.RequestException as e:
-        print(f"Error sending Telegram message: {e}")
+    except http_client.RequestException as e:
+        logger.error("Error sending Telegram message: %s", e)
         if hasattr(e, 'response') and e.response is not None:
-            print(f"Response body: {e.response.text}")
+            logger.error("Response body: %s", e.response.text)
         return False
 
+def batch_messages(messages, limit=TELEGRAM_MAX_MESSAGE_LENGTH):
+    """
+    Joins messages into as few Telegram-sized chunks as possible.
+    Messages are never split; a single oversized message becomes its own chunk.
+    """
+    chunks = []
+    current = ""
+    for msg in messages:
+        candidate = f"{current}{BATCH_SEPARATOR}{msg}" if current else msg
+        if current and len(candidate) > limit:
+            chunks.append(current)
+            current = msg
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+def send_batched_messages(messages, chat_id=None):
+    """
+    Delivers a list of messages to one recipient as a single batch. Returns True if all parts sent.
+    Parts are paced and retried by send_telegram_message().
+    """
+    results = [send_telegram_message(chunk, chat_id=chat_id) for chunk in batch_messages(messages)]
+    return all(results)
+
 if __name__ == "__main__":
     # Test block
     print("Testing Telegram Notifier (Requires proper .env vars)")
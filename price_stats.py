@@ -0,0 +1,257 @@
+"""
+Incremental per-route price statistics.
+
+Each observation updates a small state object in O(1) (amortized), so the
+scheduler can judge "is this price good for this route?" without re-reading
+price_history:
+
+  - EWMA of the price (and its exponentially weighted variance)
+  - rolling min/max over time windows (monotonic deques, at most
+    WINDOW_SLOTS entries each)
+  - approximate percentiles via a merging t-digest with bounded size
+
+The state is JSON-serializable and persisted per route in the route_stats table.
+"""
+import math
+import time
+from collections import deque
+
+EWMA_ALPHA = 0.2
+WINDOWS = {"7d": 7 * 86400, "30d": 30 * 86400}
+# Rolling min/max resolution: timestamps are rounded up to window/WINDOW_SLOTS,
+# which caps each deque at WINDOW_SLOTS + 1 entries however often a route is checked
+WINDOW_SLOTS = 240
+DIGEST_COMPRESSION = 50
+# Percentile-based alerts only kick in once a route has some history
+MIN_OBSERVATIONS_FOR_PERCENTILE = 10
+
+
+class TDigest:
+    """Merging t-digest (k1 scale function). Holds at most ~compression centroids."""
+
+    def __init__(self, compression=DIGEST_COMPRESSION, centroids=None, count=0, min_value=None, max_value=None):
+        self.compression = compression
+        self.centroids = centroids or []  # sorted [mean, weight] pairs
+        self.count = count
+        self.min = min_value
+        self.max = max_value
+        self._buffer = []
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def add(self, x, weight=1):
+        self._buffer.append([x, weight])
+        self.count += weight
+        self.min = x if self.min is None else min(self.min, x)
+        self.max = x if self.max is None else max(self.max, x)
+        if len(self._buffer) >= self.compression:
+            self._compress()
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        points = sorted(self.centroids + self._buffer)
+        self._buffer = []
+        merged = [list(points[0])]
+        weight_so_far = 0
+        k_left = self._k(0)
+        for mean, weight in points[1:]:
+            current = merged[-1]
+            q_right = (weight_so_far + current[1] + weight) / self.count
+            if self._k(q_right) - k_left <= 1:
+                total = current[1] + weight
+                current[0] += (mean - current[0]) * weight / total
+                current[1] = total
+            else:
+                weight_so_far += current[1]
+                k_left = self._k(weight_so_far / self.count)
+                merged.append([mean, weight])
+        self.centroids = merged
+
+    def quantile(self, q):
+        """Approximate value at quantile q (0..1), or None when empty."""
+        self._compress()
+        if not self.centroids:
+            return None
+        if len(self.centroids) == 1 or q <= 0:
+            return self.min if q <= 0 else self.centroids[0][0]
+        if q >= 1:
+            return self.max
+
+        target = q * self.count
+        cumulative = 0
+        prev_mean, prev_center = self.min, 0
+        for mean, weight in self.centroids:
+            center = cumulative + weight / 2
+            if target < center:
+                span = center - prev_center
+                frac = (target - prev_center) / span if span else 0
+                return prev_mean + (mean - prev_mean) * frac
+            prev_mean, prev_center = mean, center
+            cumulative += weight
+        span = self.count - prev_center
+        frac = (target - prev_center) / span if span else 0
+        return prev_mean + (self.max - prev_mean) * frac
+
+    def cdf(self, x):
+        """Approximate fraction of observations <= x."""
+        self._compress()
+        if not self.centroids:
+            return None
+        if x < self.min:
+            return 0.0
+        if x >= self.max:
+            return 1.0
+        cumulative = 0
+        prev_mean, prev_center = self.min, 0
+        for mean, weight in self.centroids:
+            center = cumulative + weight / 2
+            if x < mean:
+                span = mean - prev_mean
+                frac = (x - prev_mean) / span if span else 1
+                return (prev_center + (center - prev_center) * frac) / self.count
+            prev_mean, prev_center = mean, center
+            cumulative += weight
+        span = self.max - prev_mean
+        frac = (x - prev_mean) / span if span else 1
+        return (prev_center + (self.count - prev_center) * frac) / self.count
+
+    def to_dict(self):
+        self._compress()
+        return {"c": [[round(m, 4), w] for m, w in self.centroids], "n": self.count,
+                "min": self.min, "max": self.max}
+
+    @classmethod
+    def from_dict(cls, data, compression=DIGEST_COMPRESSION):
+        return cls(compression, [list(c) for c in data.get("c", [])], data.get("n", 0),
+                   data.get("min"), data.get("max"))
+
+
+class RollingExtremes:
+    """
+    Min and max over a sliding time window using monotonic deques. Entries
+    expire at slot granularity (window / slots), so an extreme may be kept up
+    to one slot longer than the window.
+    """
+
+    def __init__(self, window_seconds, mins=None, maxs=None, slots=WINDOW_SLOTS):
+        self.window = window_seconds
+        self.slot = window_seconds / slots
+        self._mins = deque()  # (ts, price), prices increasing
+        self._maxs = deque()  # (ts, price), prices decreasing
+        # Re-adding compacts state saved before timestamps were slotted
+        for ts, price in mins or []:
+            self._push(self._mins, ts, price, lambda kept, new: kept < new)
+        for ts, price in maxs or []:
+            self._push(self._maxs, ts, price, lambda kept, new: kept > new)
+
+    def _push(self, entries, ts, price, keeps):
+        """Appends (ts, price), dropping entries it supersedes; keeps(kept, new) is True for a better kept price."""
+        ts = math.ceil(ts / self.slot) * self.slot
+        while entries and not keeps(entries[-1][1], price):
+            entries.pop()
+        if entries and entries[-1][0] >= ts:
+            return  # a better price in the same slot expires no earlier
+        entries.append((ts, price))
+
+    def _evict(self, now):
+        cutoff = now - self.window
+        while self._mins and self._mins[0][0] < cutoff:
+            self._mins.popleft()
+        while self._maxs and self._maxs[0][0] < cutoff:
+            self._maxs.popleft()
+
+    def add(self, ts, price):
+        self._push(self._mins, ts, price, lambda kept, new: kept < new)
+        self._push(self._maxs, ts, price, lambda kept, new: kept > new)
+        self._evict(ts)
+
+    def min(self, now=None):
+        self._evict(now or time.time())
+        return self._mins[0][1] if self._mins else None
+
+    def max(self, now=None):
+        self._evict(now or time.time())
+        return self._maxs[0][1] if self._maxs else None
+
+    def to_dict(self):
+        return {"min": [list(p) for p in self._mins], "max": [list(p) for p in self._maxs]}
+
+
+class RouteStats:
+    """All streaming statistics for one route."""
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.count = state.get("count", 0)
+        self.ewma = state.get("ewma")
+        self.ewvar = state.get("ewvar", 0.0)
+        self.last_price = state.get("last_price")
+        self.last_ts = state.get("last_ts")
+        # Values before the latest update(), for alert rules (not persisted)
+        self.prev_ewma = self.ewma
+        self.prev_price = self.last_price
+        self.digest = TDigest.from_dict(state.get("digest", {}))
+        windows = state.get("windows", {})
+        self.windows = {
+            name: RollingExtremes(seconds, windows.get(name, {}).get("min"), windows.get(name, {}).get("max"))
+            for name, seconds in WINDOWS.items()
+        }
+
+    def update(self, price, ts=None):
+        """Folds one observation into every statistic."""
+        ts = ts or time.time()
+        self.prev_ewma = self.ewma
+        self.prev_price = self.last_price
+        if self.ewma is None:
+            self.ewma = price
+        else:
+            diff = price - self.ewma
+            incr = EWMA_ALPHA * diff
+            self.ewma += incr
+            self.ewvar = (1 - EWMA_ALPHA) * (self.ewvar + diff * incr)
+        for window in self.windows.values():
+            window.add(ts, price)
+        self.digest.add(price)
+        self.count += 1
+        self.last_price = price
+        self.last_ts = ts
+
+    def percentile(self, q):
+        return self.digest.quantile(q)
+
+    def percentile_rank(self, price):
+        """Approximate share of this route's observations at or below price (0..1)."""
+        return self.digest.cdf(price)
+
+    def is_in_bottom(self, price, fraction=0.10):
+        """True if price is among the cheapest `fraction` seen for this route."""
+        if self.count < MIN_OBSERVATIONS_FOR_PERCENTILE:
+            return False
+        return price <= self.percentile(fraction)
+
+    def summary(self):
+        """Compact read-only view for the API and dashboard."""
+        def rounded(value):
+            return round(value, 2) if value is not None else None
+        return {
+            "observations": self.count,
+            "ewma": rounded(self.ewma),
+            "p10": rounded(self.percentile(0.10)),
+            "median": rounded(self.percentile(0.50)),
+            "min_7d": self.windows["7d"].min(),
+            "min_30d": self.windows["30d"].min(),
+            "max_30d": self.windows["30d"].max(),
+        }
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "ewma": self.ewma,
+            "ewvar": self.ewvar,
+            "last_price": self.last_price,
+            "last_ts": self.last_ts,
+            "digest": self.digest.to_dict(),
+            "windows": {name: w.to_dict() for name, w in self.windows.items()},
+        }
@@ -0,0 +1,227 @@
+"""
+One-shot profiling of a scheduler cycle.
+
+Arming the 'profile_next_cycle' setting (from the dashboard sidebar) makes the
+next job() run under cProfile and tracemalloc. Each profiled cycle leaves
+three files in PROFILE_DIR, named by start time:
+
+    cycle-YYYYmmdd-HHMMSS.prof   raw cProfile stats (open with pstats or snakeviz)
+    cycle-YYYYmmdd-HHMMSS.txt    hottest functions and top allocation sites
+    cycle-YYYYmmdd-HHMMSS.json   summary shown on the dashboard
+
+Unarmed cycles run the job directly, so there is no profiler overhead.
+
+Before Python 3.12 cProfile only sees the thread it runs in, so work handed
+to a thread pool (hedged flight searches) is wrapped with profile_worker():
+while a cycle is being profiled each task runs under its own profiler and
+the results are merged into the cycle's report. From 3.12 cProfile is built
+on sys.monitoring, which covers every thread but allows a single active
+profiler, so pool tasks are simply counted. If another tool (a debugger,
+coverage) already holds the profiler hook the cycle runs unprofiled.
+Only the newest PROFILE_KEEP reports are kept.
+"""
+import cProfile
+import glob
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+from database import DATA_DIR, get_setting, set_setting
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.path.join(DATA_DIR, 'profiles')
+PROFILE_SETTING = 'profile_next_cycle'
+TOP_FUNCTIONS = 15
+TOP_ALLOCATIONS = 10
+TRACEMALLOC_FRAMES = 5
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "10"))
+
+SHARED_PROFILER = sys.version_info >= (3, 12)  # one sys.monitoring profiler sees all threads
+
+_worker_profiles = None  # list while a cycle is profiled; filled by profile_worker()
+_worker_lock = threading.Lock()
+
+
+def is_armed():
+    return get_setting(PROFILE_SETTING) == '1'
+
+
+def arm(enabled=True):
+    """Profiles the next scheduler cycle (or cancels a pending one)."""
+    set_setting(PROFILE_SETTING, '1' if enabled else '0')
+
+
+def profile_worker(fn, *args):
+    """Runs fn(*args) from a pool thread, under its own profiler while a cycle is being profiled."""
+    if _worker_profiles is None:
+        return fn(*args)
+    profiler = None
+    if not SHARED_PROFILER:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # another profiling tool is active
+            profiler = None
+    try:
+        return fn(*args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        with _worker_lock:
+            if _worker_profiles is not None:
+                _worker_profiles.append(profiler)  # None: seen by the cycle's profiler, or not at all
+
+
+def _merged_stats(profiler, workers, stream=None):
+    stats = pstats.Stats(profiler, stream=stream)
+    for worker in workers:
+        if worker is not None:
+            stats.add(worker)
+    return stats
+
+
+def _top_functions(stats):
+    rows = []
+    for (filename, line, name), (cc, nc, tottime, cumtime, _) in stats.stats.items():
+        rows.append({
+            "function": f"{os.path.basename(filename)}:{line}({name})",
+            "calls": nc,
+            "tottime": round(tottime, 4),
+            "cumtime": round(cumtime, 4),
+        })
+    rows.sort(key=lambda r: r["cumtime"], reverse=True)
+    return rows[:TOP_FUNCTIONS]
+
+
+def _top_allocations(snapshot):
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ])
+    return [
+        {"site": f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+         "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+        for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+    ]
+
+
+def profile_call(fn, profile_dir=PROFILE_DIR):
+    """
+    Runs fn() under cProfile and tracemalloc and writes the report files.
+    Returns the summary dict (None if another profiler was active and fn ran
+    unprofiled); an exception from fn is re-raised after the report is written.
+    """
+    os.makedirs(profile_dir, exist_ok=True)
+    base = os.path.join(profile_dir, time.strftime("cycle-%Y%m%d-%H%M%S"))
+    started_at = time.time()
+
+    global _worker_profiles
+    with _worker_lock:
+        _worker_profiles = []
+
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:  # e.g. "Another profiling tool is already active" on 3.12+
+        logger.warning("Cannot profile this cycle (%s); running it unprofiled.", e)
+        if not already_tracing:
+            tracemalloc.stop()
+        with _worker_lock:
+            _worker_profiles = None
+        fn()
+        return None
+    start = time.perf_counter()
+    failure = None
+    try:
+        fn()
+    except Exception as e:
+        failure = e
+    finally:
+        profiler.disable()
+    duration = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    if not already_tracing:
+        tracemalloc.stop()
+    with _worker_lock:
+        workers, _worker_profiles = _worker_profiles, None
+    report = io.StringIO()
+    stats = _merged_stats(profiler, workers, stream=report)
+
+    summary = {
+        "started_at": started_at,
+        "duration_seconds": round(duration, 3),
+        "peak_memory_kb": round(peak / 1024, 1),
+        "error": repr(failure) if failure else None,
+        "worker_tasks": len(workers),
+        "top_functions": _top_functions(stats),
+        "top_allocations": _top_allocations(snapshot),
+    }
+
+    stats.dump_stats(base + ".prof")
+    stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+    report.write("\nTop allocation sites\n")
+    for alloc in summary["top_allocations"]:
+        report.write(f"  {alloc['site']}: {alloc['size_kb']} KiB in {alloc['count']} blocks\n")
+    with open(base + ".txt", "w") as f:
+        f.write(report.getvalue())
+    with open(base + ".json", "w") as f:
+        json.dump(summary, f, indent=2)
+
+    prune_profiles(profile_dir)
+
+    logger.info("Profiled cycle: %.2fs, peak %.0f KiB, %d pool task(s), report in %s.txt",
+                duration, summary["peak_memory_kb"], len(workers), base)
+    if failure is not None:
+        raise failure
+    return summary
+
+
+def prune_profiles(profile_dir=PROFILE_DIR, keep=PROFILE_KEEP):
+    """Deletes the report files of all but the newest `keep` profiled cycles (0 keeps everything)."""
+    if keep <= 0:
+        return
+    bases = sorted(path[:-len(".json")] for path in glob.glob(os.path.join(profile_dir, "cycle-*.json")))
+    for base in bases[:-keep]:
+        for ext in (".prof", ".txt", ".json"):
+            if os.path.exists(base + ext):
+                os.remove(base + ext)
+
+
+def run_maybe_profiled(fn):
+    """Runs fn, under the profiler if profiling was armed (disarming it first)."""
+    if not is_armed():
+        fn()
+        return
+    arm(False)
+    profile_call(fn)
+
+
+def latest_summary(profile_dir=PROFILE_DIR):
+    """The most recent profile summary, or None."""
+    paths = sorted(glob.glob(os.path.join(profile_dir, "cycle-*.json")))
+    if not paths:
+        return None
+    with open(paths[-1], "r") as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    import tempfile
+    out = tempfile.mkdtemp()
+    summary = profile_call(lambda: sorted(str(i) for i in range(200000)), profile_dir=out)
+    print(f"duration {summary['duration_seconds']}s, peak {summary['peak_memory_kb']} KiB")
+    for row in summary["top_functions"][:5]:
+        print(f"  {row['cumtime']:8.4f}s  {row['function']}")
+    print("Reports written to", out)
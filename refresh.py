@@ -0,0 +1,280 @@
+"""
+On-demand price refresh with single-flight request coalescing.
+
+Every flight search (scheduled or "check now") goes through fetch_offer():
+
+  1. A result for the same search key younger than FRESHNESS_SECONDS is
+     reused from the search_cache table, so no API call is made at all.
+  2. Within a process, concurrent callers for the same key share one
+     in-flight call (SingleFlight); all waiters get the same result.
+  3. Across processes (dashboard vs. scheduler/API), a lease row in
+     search_cache marks the search as in flight; other processes wait for
+     its result instead of issuing a duplicate call.
+
+Offers carry a quoted_at stamp, so a cached quote is recorded once per route
+(record_observation) however many checks are served from it.
+
+Before a scheduled cycle, prefetch_offers() fills the cache in bulk: each
+route is searched with a window request covering the provider's batch span
+of departure days, routes sharing an origin and destination within one span
+share a request, and the answer is split back out per route (the window's
+other days fill the fare calendar). Anything the batch doesn't answer
+(errors, days without offers) is left to the usual per-route search.
+"""
+import logging
+import threading
+import time
+
+from database import (get_cached_search, store_search_result, claim_search_lease,
+                      release_search_lease, record_price, update_lowest_price,
+                      get_route_stats, save_route_stats, upsert_fare, upsert_fares)
+from price_stats import RouteStats
+
+logger = logging.getLogger(__name__)
+
+FRESHNESS_SECONDS = 300       # results younger than this are served without calling the API
+LEASE_SECONDS = 30            # upper bound on a search held by another process
+LEASE_POLL_SECONDS = 0.5
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers share its outcome."""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+            self.waiters = 0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0  # callers served by someone else's in-flight call
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+_flights = SingleFlight()
+
+
+def search_key(origin, destination, date_from=None, date_to=None):
+    """Identifies searches that return the same answer."""
+    return f"{origin.upper()}:{destination.upper()}:{date_from or ''}:{date_to or ''}"
+
+
+def _wait_for_other_process(key, started):
+    """Polls search_cache until the lease holder stores a result or the lease lapses."""
+    deadline = started + LEASE_SECONDS
+    while time.time() < deadline:
+        time.sleep(LEASE_POLL_SECONDS)
+        found, result = get_cached_search(key, time.time() - started)
+        if found:
+            return True, result
+    return False, None
+
+
+def _search(key, search):
+    """Runs search() under a cross-process lease for key and stores its result."""
+    started = time.time()
+    if not claim_search_lease(key, LEASE_SECONDS):
+        logger.info("Search %s already in flight in another process; waiting for its result", key)
+        found, result = _wait_for_other_process(key, started)
+        if found:
+            return result
+        claim_search_lease(key, LEASE_SECONDS)
+
+    try:
+        result = search()
+    except BaseException:
+        release_search_lease(key)
+        raise
+    store_search_result(key, result)
+    return result
+
+
+def _cached_or_search(key, search, max_age):
+    if max_age:
+        found, result = get_cached_search(key, max_age)
+        if found:
+            return result
+    return _flights.do(key, lambda: _search(key, search))
+
+
+def fetch_offer(origin, destination, date_from=None, date_to=None, max_age=FRESHNESS_SECONDS):
+    """
+    Returns the cheapest offer for a search (same dict as check_flights, or None),
+    reusing a fresh cached result or an in-flight search when one exists.
+    """
+    from flight_search import check_flights
+
+    key = search_key(origin, destination, date_from, date_to)
+    return _cached_or_search(key, lambda: _quoted(check_flights(
+        origin_city_code=origin,
+        destination_city_code=destination,
+        from_time=date_from,
+        to_time=date_to
+    )), max_age)
+
+
+def _quoted(flight):
+    """Stamps an offer with when the provider returned it; cached copies keep the stamp."""
+    if flight is not None:
+        flight['quoted_at'] = time.time()
+    return flight
+
+
+def _batch_groups(searches, span_days):
+    """Groups (key, origin, destination, day) searches into runs of one route within span_days."""
+    import datetime as dt
+    by_route = {}
+    for search in searches:
+        by_route.setdefault((search[1], search[2]), []).append(search)
+    for route_searches in by_route.values():
+        route_searches.sort(key=lambda s: s[3])
+        group = []
+        for search in route_searches:
+            if group and (dt.date.fromisoformat(search[3]) - dt.date.fromisoformat(group[0][3])).days >= span_days:
+                yield group
+                group = []
+            group.append(search)
+        yield group
+
+
+def prefetch_offers(destinations, max_age=FRESHNESS_SECONDS, pause_seconds=0):
+    """
+    Searches a cycle's routes with multi-day window requests, as few as possible,
+    and caches the per-route answers so fetch_offer() then finds them. Every
+    day in a window that falls inside a route's travel dates goes into that
+    route's fare calendar. pause_seconds spaces the requests out (rate limits).
+    Returns the set of search keys answered here.
+    """
+    from flight_search import FLIGHT_PROVIDER, get_provider, search_date, check_flights_batch
+
+    provider = get_provider(FLIGHT_PROVIDER)
+    if provider is None or not provider.batch_days:
+        return set()
+
+    searches = {}
+    for dest in destinations:
+        key = search_key(dest['departure_city_code'], dest['destination_city_code'], dest['date_from'], dest['date_to'])
+        if key not in searches and not get_cached_search(key, max_age)[0]:
+            searches[key] = (key, dest['departure_city_code'].upper(), dest['destination_city_code'].upper(),
+                             search_date(dest['date_from']))
+
+    answered = set()
+    windows = {}  # search key -> {day: flight} for the whole window it was answered from
+    batches = 0
+    for group in _batch_groups(searches.values(), provider.batch_days):
+        # A window request costs the same as a single-day search, so lone routes use one too
+        claimed = [s for s in group if claim_search_lease(s[0], LEASE_SECONDS)]
+        if not claimed:
+            continue
+        if batches and pause_seconds:
+            time.sleep(pause_seconds)
+        _, origin, destination, _ = claimed[0]
+        batches += 1
+        found = check_flights_batch(origin, destination, [s[3] for s in claimed])
+        for key, _, _, day in claimed:
+            if found.get(day):
+                store_search_result(key, _quoted(found[day]))
+                answered.add(key)
+                windows[key] = found
+            else:
+                release_search_lease(key)  # falls back to its own search
+
+    for dest in destinations:
+        found = windows.get(search_key(dest['departure_city_code'], dest['destination_city_code'],
+                                       dest['date_from'], dest['date_to']))
+        if found:
+            first, last = search_date(dest['date_from']), dest['date_to'] or '9999-12-31'
+            upsert_fares(dest['id'], [(day, flight['price']) for day, flight in found.items() if first <= day <= last])
+
+    if batches:
+        logger.info("Searched %d route(s) with %d window request(s) (batch factor %.2f)",
+                    len(answered), batches, len(answered) / batches)
+    return answered
+
+
+def anywhere_key(origin, departure_date=None):
+    return f"{origin.upper()}:*:{departure_date or ''}"
+
+
+def fetch_destinations(origin, departure_date=None, max_age=FRESHNESS_SECONDS):
+    """
+    Cheapest destinations from one origin ("anywhere" search), shared by every
+    watch on that origin and date. Returns a list (cheapest first) or None.
+    """
+    from flight_search import find_destinations
+
+    key = anywhere_key(origin, departure_date)
+    return _cached_or_search(key, lambda: find_destinations(origin, departure_date), max_age)
+
+
+def cached_destinations(origin, departure_date=None):
+    """The last stored "anywhere" result for an origin without searching, or None."""
+    found, result = get_cached_search(anywhere_key(origin, departure_date), float("inf"))
+    return result if found else None
+
+
+def destinations_under_budget(results, max_price, limit=10):
+    """Filters an "anywhere" result to max_price and adds display names from the airport index."""
+    from airports import display_name
+
+    matches = [dict(r, name=display_name(r["destination"])) for r in results or [] if r["price"] <= max_price]
+    return matches[:limit]
+
+
+def record_observation(dest, price, departure_date=None, quoted_at=None):
+    """
+    Stores a price for a route, updates its lowest price seen and folds it into
+    the route's streaming statistics and fare calendar. Returns (is_new_low, stats),
+    or None if this quote (e.g. a cached result another check was served) is
+    already recorded for the route.
+    """
+    if not record_price(dest['id'], price, quoted_at):
+        return None
+    if departure_date:
+        upsert_fare(dest['id'], departure_date, price)
+    stats = RouteStats(get_route_stats(dest['id']))
+    stats.update(price)
+    save_route_stats(dest['id'], stats.to_dict())
+
+    is_new_low = dest['lowest_price_seen'] is None or price < dest['lowest_price_seen']
+    if is_new_low:
+        update_lowest_price(dest['id'], price)
+    return is_new_low, stats
+
+
+def check_route_now(dest, max_age=FRESHNESS_SECONDS):
+    """Refreshes one route outside the scheduled cycle. Returns the offer or None."""
+    flight = fetch_offer(dest['departure_city_code'], dest['destination_city_code'],
+                         dest['date_from'], dest['date_to'], max_age=max_age)
+    if flight is not None:
+        record_observation(dest, flight['price'], flight['outbound_date'], flight.get('quoted_at'))
+    return flight